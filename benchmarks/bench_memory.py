@@ -0,0 +1,236 @@
+"""Memory profile of the list endpoints per parser mode.
+
+Usage:
+    python benchmarks/bench_memory.py                   # run and compare
+    python benchmarks/bench_memory.py --save            # update the baseline
+    python benchmarks/bench_memory.py --records 10000 --breakdown
+    python benchmarks/bench_memory.py --filter calls.model
+
+Every case calls one endpoint through API, answered with a synthetic page
+of --records records (see payloads.py), and parses it with one parser
+mode: raw (RawParser, the body string), json (JSONParser, plain dicts) or
+model (ModelParser, the default). tracemalloc measures the bytes retained
+by the result per record and the peak allocated while fetching and
+parsing it, per record.
+
+--breakdown splits the retained bytes of model results by owner: each
+model class (its instance, __dict__ and attribute values), the raw _json
+dict every model keeps, and the ResultSet lists. Objects shared between
+owners are counted once, for the first owner visited, so _json only gets
+what nothing else refers to. Shared constants such as interned keys are
+included too, so the breakdown adds up to a little more than the retained
+bytes.
+
+Results are compared with benchmarks/memory_baseline.json, and the script
+exits with status 1 when a case retains or peaks more than --threshold
+above it. Allocation sizes depend on the Python version; regenerate the
+baseline with --save when changing it.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import payloads  # noqa: E402
+
+from ringplus.api import API  # noqa: E402
+from ringplus.models import Model, ResultSet  # noqa: E402
+from ringplus.parsers import JSONParser, ModelParser, RawParser  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'memory_baseline.json')
+
+# name -> (function(api) calling the endpoint, function(count) -> payload)
+ENDPOINTS = collections.OrderedDict([
+    ('calls', (lambda api: api.calls(account_id=1),
+               lambda n: payloads.list_payload('call', n))),
+    ('texts', (lambda api: api.texts(account_id=1),
+               lambda n: payloads.list_payload('text', n))),
+    ('data', (lambda api: api.data(account_id=1),
+              lambda n: payloads.list_payload('data', n))),
+    ('voicemail', (lambda api: api.voicemail(voicemail_box_id=1),
+                   lambda n: payloads.list_payload('voicemail', n))),
+    ('user_accounts', (lambda api: api.user_accounts(user_id=1),
+                       lambda n: payloads.list_payload('account', n))),
+    ('accounts_detailed', (lambda api: api.accounts(),
+                           lambda n: {'accounts': [
+                               payloads.account(i, detailed=True)
+                               for i in range(n)]})),
+    ('users', (lambda api: api.users(),
+               lambda n: payloads.list_payload('user', n))),
+])
+
+PARSERS = collections.OrderedDict([
+    ('raw', RawParser),
+    ('json', JSONParser),
+    ('model', ModelParser),
+])
+
+
+class _Response(object):
+    """Decodes its body on every access to text, like requests does."""
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+
+class _Session(object):
+
+    def __init__(self, content):
+        self.response = _Response(content)
+
+    def request(self, *args, **kwargs):
+        return self.response
+
+
+def measure(call, body):
+    """Return (result, retained bytes, peak bytes) of one call.
+
+    The encoded body exists before measuring, like a received network
+    buffer; decoding and parsing it is measured.
+    """
+    api = API(parser=call[1]())
+    api.session = _Session(body)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = call[0](api)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - before, peak - before
+
+
+def breakdown(result):
+    """Return the bytes retained by result, per owner."""
+    sizes = collections.Counter()
+    seen = set()
+
+    def visit(obj, owner):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        if isinstance(obj, Model):
+            visit_model(obj)
+            return
+        if isinstance(obj, ResultSet):
+            owner = 'ResultSet'
+            sizes[owner] += sys.getsizeof(obj.__dict__)
+        sizes[owner] += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                visit(key, owner)
+                visit(value, owner)
+        elif isinstance(obj, (list, tuple)):
+            for value in obj:
+                visit(value, owner)
+
+    def visit_model(model):
+        name = type(model).__name__
+        sizes[name] += sys.getsizeof(model) + sys.getsizeof(model.__dict__)
+        # Attributes first, so that _json only gets what it alone keeps
+        for key, value in model.__dict__.items():
+            if key not in ('_api', '_json'):
+                visit(key, name)
+                visit(value, name)
+        if '_json' in model.__dict__:
+            visit(model._json, name + '._json')
+
+    visit(result, type(result).__name__)
+    return sizes
+
+
+def cases(args):
+    for endpoint, (call, payload) in ENDPOINTS.items():
+        body = payloads.body(payload(args.records)).encode('utf-8')
+        for mode, parser in PARSERS.items():
+            yield '%s.%s' % (endpoint, mode), (call, parser), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000,
+                        help='records per synthetic page (default 1000)')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='allowed growth as a fraction (default 0.05)')
+    parser.add_argument('--filter', default='',
+                        help='only run cases containing this string')
+    parser.add_argument('--breakdown', action='store_true',
+                        help='show retained bytes per model of model cases')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print('%-28s %12s %12s %12s %9s' % ('case', 'retained', 'bytes/rec',
+                                        'peak/rec', 'change'))
+    for name, call, body in cases(args):
+        if args.filter not in name:
+            continue
+        result, retained, peak = measure(call, body)
+        per_record = retained / float(args.records)
+        peak_per_record = peak / float(args.records)
+        results[name] = {'bytes_per_record': round(per_record, 1),
+                         'peak_per_record': round(peak_per_record, 1),
+                         'records': args.records}
+        change = ''
+        # Per record costs shift with the page size, compare like for like
+        if name in baseline and \
+                baseline[name].get('records') == args.records:
+            old = baseline[name]
+            ratio = per_record / old['bytes_per_record'] - 1
+            change = '%+.1f%%' % (ratio * 100)
+            limit = 1 + args.threshold
+            if per_record > old['bytes_per_record'] * limit or \
+                    peak_per_record > old['peak_per_record'] * limit:
+                regressions.append(name)
+                change += ' !'
+        print('%-28s %12d %12.1f %12.1f %9s' % (
+            name, retained, per_record, peak_per_record, change))
+        if args.breakdown and name.endswith('.model'):
+            sizes = breakdown(result)
+            total = float(sum(sizes.values())) or 1.0
+            for owner, size in sizes.most_common():
+                print('    %-32s %12.1f %6.1f%%' % (
+                    owner, size / float(args.records), size / total * 100))
+        del result
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline saved to %s' % args.baseline)
+    elif regressions:
+        print('FAIL: memory regressed against the baseline: %s'
+              % ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Throughput of parsing in worker processes against the calling process.
+
+Usage:
+    python benchmarks/bench_parallel_parse.py
+    python benchmarks/bench_parallel_parse.py --pages 200 --per-page 100 \\
+        --payload-type text --workers 1,2,4,8
+
+Parses --pages synthetic response bodies (see payloads.py) in three ways:
+into models with ModelParser in this process, into ColumnBatch objects in
+this process, and into ColumnBatch objects with ParallelParser for every
+worker count given. The report gives records per second and the speedup
+over ModelParser; the parallel rows include the cost of sending bodies to
+the workers and batches back.
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import payloads  # noqa: E402
+
+from ringplus.columnar import ParallelParser, parse_columns  # noqa: E402
+from ringplus.models import ModelFactory  # noqa: E402
+from ringplus.utils import import_simplejson  # noqa: E402
+
+json = import_simplejson()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--payload-type', default='call')
+    parser.add_argument('--workers', default=None,
+                        help='comma separated worker counts (default: 1, 2, '
+                             '4, ... up to the number of CPUs)')
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= multiprocessing.cpu_count():
+            worker_counts.append(worker_counts[-1] * 2)
+
+    bodies = [payloads.body(payloads.list_payload(
+        args.payload_type, args.per_page, page * args.per_page))
+        for page in range(args.pages)]
+    records = args.pages * args.per_page
+    model = getattr(ModelFactory, args.payload_type)
+
+    def model_parse():
+        for body in bodies:
+            model.parse_list(None, json.loads(body))
+
+    def column_parse():
+        for body in bodies:
+            parse_columns(args.payload_type, body)
+
+    def timed(name, function):
+        started = time.time()
+        function()
+        return name, records / (time.time() - started)
+
+    results = [timed('models, this process', model_parse),
+               timed('columns, this process', column_parse)]
+    for workers in worker_counts:
+        with ParallelParser(workers) as pool:
+            # Start the processes before timing
+            list(pool.map(args.payload_type, bodies[:workers]))
+            results.append(timed(
+                'columns, %d workers' % workers,
+                lambda: list(pool.map(args.payload_type, bodies))))
+
+    print('%d CPUs, %d bodies of %d %s records\n' % (
+        multiprocessing.cpu_count(), args.pages, args.per_page,
+        args.payload_type))
+    print('%-26s %14s %9s' % ('mode', 'records/sec', 'speedup'))
+    baseline = results[0][1]
+    for name, rate in results:
+        print('%-26s %14.0f %8.2fx' % (name, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""Offline micro-benchmarks of the parse and model pipeline.
+
+Usage:
+    python benchmarks/bench_parse.py                  # run and compare
+    python benchmarks/bench_parse.py --save           # update the baseline
+    python benchmarks/bench_parse.py --filter model.  # run a subset
+
+Every benchmark runs against synthetic payloads (see payloads.py) or, with
+--payload-dir, recorded bodies named <payload_type>.json. Results are
+reported in operations per second and in bytes allocated at peak during
+one operation. They are compared with the saved baseline
+(benchmarks/baseline.json) and the script exits with status 1 when any
+benchmark is slower than the baseline by more than --threshold in each of
+1 + --retries measurements, or allocates more than 10% above it.
+
+The committed baseline was measured on one developer machine; regenerate
+it with --save on the machine used for comparisons.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import payloads  # noqa: E402
+
+from ringplus.api import API  # noqa: E402
+from ringplus.models import ModelFactory, ResultSet  # noqa: E402
+from ringplus.parsers import JSONParser, ModelParser  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# Items in every synthetic list payload
+PAGE_SIZE = 100
+
+
+class _Method(object):
+    """The attributes of an APIMethod that the parsers use."""
+
+    def __init__(self, payload_type, payload_list):
+        self.api = None
+        self.payload_type = payload_type
+        self.payload_list = payload_list
+        self.params = {}
+
+
+class _Response(object):
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _Session(object):
+    """Answers every request with the same body, without a network."""
+
+    def __init__(self, text):
+        self.response = _Response(text)
+
+    def request(self, *args, **kwargs):
+        return self.response
+
+
+def _body(args, payload_type, payload):
+    if args.payload_dir:
+        text = payloads.recorded(args.payload_dir, payload_type)
+        if text is not None:
+            return text
+    return payloads.body(payload)
+
+
+def benchmarks(args):
+    """Return a list of (name, callable) pairs."""
+    cases = []
+    json_parser = JSONParser()
+    model_parser = ModelParser()
+
+    for payload_type in sorted(payloads.PAYLOADS):
+        model = getattr(ModelFactory, payload_type)
+        if payload_type == 'id':
+            payload = {'ids': list(range(PAGE_SIZE))}
+            payload_list = False
+        else:
+            payload = payloads.list_payload(payload_type, PAGE_SIZE)
+            payload_list = True
+        text = _body(args, payload_type, payload)
+        decoded = json.loads(text)
+        method = _Method(payload_type, payload_list)
+
+        cases.append(('json_parser.%s' % payload_type,
+                      lambda m=method, t=text: json_parser.parse(m, t)))
+        cases.append(('model_parser.%s' % payload_type,
+                      lambda m=method, t=text: model_parser.parse(m, t)))
+        if payload_list:
+            cases.append(('model.%s.parse_list' % payload_type,
+                          lambda c=model, d=decoded: c.parse_list(None, d)))
+        item = payloads.items(payload_type, 1)[0]
+        if payload_type != 'id':
+            cases.append(('model.%s.parse' % payload_type,
+                          lambda c=model, d=item: c.parse(None, d)))
+
+    detailed = payloads.account(1, detailed=True)
+    cases.append(('model.account.parse_detailed',
+                  lambda: ModelFactory.account.parse(None, detailed)))
+
+    calls = ModelFactory.call.parse_list(
+        None, payloads.list_payload('call', 1000))
+
+    def build_result_set():
+        results = ResultSet()
+        for call in calls:
+            results.append(call)
+        return results
+
+    cases.append(('result_set.append_1000', build_result_set))
+    cases.append(('result_set.ids_1000', calls.ids))
+    cases.append(('result_set.max_id_1000', lambda: calls.max_id))
+    cases.append(('result_set.since_id_1000', lambda: calls.since_id))
+
+    api = API()
+    api.session = _Session(payloads.body(
+        payloads.list_payload('call', PAGE_SIZE)))
+    cases.append(('bind_api.create', lambda: api.calls(
+        account_id=1, start_date='2016-01-01', page=2, per_page=100,
+        create=True)))
+    raw_api = API(parser=JSONParser())
+    raw_api.session = _Session('[]')
+    cases.append(('bind_api.execute_empty', lambda: raw_api.calls(
+        account_id=1, page=2)))
+    cases.append(('bind_api.execute_calls_page', lambda: api.calls(
+        account_id=1, page=2)))
+    return cases
+
+
+def measure(function, min_time, repeat):
+    """Return (ops/sec, peak bytes allocated by one call).
+
+    The median of several rounds is kept, so a round slowed down by other
+    processes does not count.
+    """
+    function()  # warm up
+    rates = []
+    # As timeit does, so collections triggered by earlier benchmarks
+    # don't land on this one
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            count = 0
+            start = time.time()
+            elapsed = 0.0
+            while elapsed < min_time / repeat:
+                for _ in range(10):
+                    function()
+                count += 10
+                elapsed = time.time() - start
+            rates.append(count / elapsed)
+    finally:
+        gc.enable()
+    rates.sort()
+    median = rates[len(rates) // 2]
+
+    tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):
+        # Python 3.9+, in case tracing was already on
+        tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    function()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return median, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='allowed slowdown as a fraction (default 0.5, '
+                             'small virtual machines vary by 40%% from one '
+                             'minute to the next)')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='seconds spent on each benchmark')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='rounds per benchmark, the median counts')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='times a slower benchmark is measured again '
+                             'before it counts as a regression, and extra '
+                             'measurements taken with --save')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks containing this string')
+    parser.add_argument('--payload-dir', default=None,
+                        help='directory of recorded <payload_type>.json')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print('%-42s %14s %12s %9s' % ('benchmark', 'ops/sec', 'bytes', 'change'))
+    for name, function in benchmarks(args):
+        if args.filter not in name:
+            continue
+        ops, peak = measure(function, args.min_time, args.repeat)
+        if args.save:
+            # A baseline caught in a fast moment fails every later run
+            rates = [ops] + [measure(function, args.min_time,
+                                     args.repeat)[0]
+                             for _ in range(args.retries)]
+            ops = sorted(rates)[len(rates) // 2]
+        elif name in baseline:
+            # A slowdown has to show up in every measurement to count
+            for _ in range(args.retries):
+                if ops >= baseline[name]['ops_per_sec'] * \
+                        (1 - args.threshold):
+                    break
+                ops = max(ops, measure(function, args.min_time,
+                                       args.repeat)[0])
+        results[name] = {'ops_per_sec': round(ops, 1), 'bytes': peak}
+        change = ''
+        if name in baseline:
+            ratio = ops / baseline[name]['ops_per_sec'] - 1
+            change = '%+.1f%%' % (ratio * 100)
+            # Allocations are deterministic, so they get a tighter check.
+            grown = peak > baseline[name]['bytes'] * 1.1 + 1024
+            if ratio < -args.threshold or grown:
+                regressions.append(name)
+                change += ' !'
+        print('%-42s %14.1f %12d %9s' % (name, ops, peak, change))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline saved to %s' % args.baseline)
+    elif regressions:
+        print('FAIL: regressed against the baseline: %s'
+              % ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
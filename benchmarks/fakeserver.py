@@ -0,0 +1,317 @@
+"""A local fake RingPlus API server for load and stress tests.
+
+Usage:
+    python benchmarks/fakeserver.py --port 8080 --latency 0.02 \\
+        --error-rate 0.01 --rate-limit 1000
+
+Then point an API at it::
+
+    api = API(host='localhost:8080', scheme='http')
+
+Every path of ringplus/api.py is served with synthetic data from
+payloads.py. Usage records carry the account_id (or voicemail_box_id) of
+the request, and every response echoes the request line and the
+Authorization header in x-fake-request and x-fake-token, so clients can
+check that they got the answer to their own question. The server can add
+latency, fail a fraction of the requests with 500 and enforce a per-token
+rate limit with x-rate-limit-* headers and 429 + retry-after.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs, urlparse
+
+import payloads
+
+# (method, path template, payload type, list response, owner variable)
+ROUTES = [
+    ('GET', '/users/{user_id}/accounts', 'account', True, None),
+    ('GET', '/accounts', 'account', True, None),
+    ('GET', '/accounts/{account_id}', 'account', False, None),
+    ('PUT', '/accounts/{account_id}', None, False, None),
+    ('POST', '/users/{user_id}/account_registration_requests', 'request',
+     False, None),
+    ('GET', '/account_registration_requests/{request_id}', 'request', True,
+     None),
+    ('POST', '/accounts/{account_id}/device_change_requests', 'request',
+     False, None),
+    ('GET', '/device_change_requests/{request_id}', 'request', True, None),
+    ('POST', '/accounts/{account_id}/phone_number_change_requests',
+     'request', False, None),
+    ('GET', '/phone_number_change_requests/{request_id}', 'request', True,
+     None),
+    ('GET', '/accounts/{account_id}/enforced_carrier_services',
+     'carrier_service', True, None),
+    ('GET', '/accounts/{account_id}/fluidcall_credentials', 'fluidcall',
+     True, None),
+    ('GET', '/accounts/{account_id}/phone_calls', 'call', True,
+     'account_id'),
+    ('GET', '/accounts/{account_id}/phone_texts', 'text', True,
+     'account_id'),
+    ('GET', '/accounts/{account_id}/phone_data', 'data', True,
+     'account_id'),
+    ('GET', '/users/{user_id}', 'user', False, None),
+    ('GET', '/users', 'user', True, None),
+    ('PUT', '/users/{user_id}', None, False, None),
+    ('GET', '/voicemail_boxes/{voicemail_box_id}/voicemail_messages',
+     'voicemail', True, 'voicemail_box_id'),
+    ('DELETE', '/voicemail_messages/{voicemail_message_id}', None, False,
+     None),
+]
+
+
+def _compile(template):
+    return re.compile('^' + re.sub(r'{(\w+)}', r'(?P<\1>[^/]+)', template) +
+                      '$')
+
+
+_ROUTES = [(method, _compile(template), payload_type, is_list, owner)
+           for method, template, payload_type, is_list, owner in ROUTES]
+
+
+class Config(object):
+    """Behaviour of the fake server."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit=None, rate_window=60, retry_after=1,
+                 records=500):
+        # Seconds added to every response, +- jitter
+        self.latency = latency
+        self.jitter = jitter
+        # Fraction of requests answered with a 500
+        self.error_rate = error_rate
+        # Requests allowed per token and window, None for no limit
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.retry_after = retry_after
+        # Length of every paged history
+        self.records = records
+
+
+class _RateLimits(object):
+    """Fixed window request counters per access token."""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def take(self, token):
+        """Return (allowed, remaining, reset)."""
+        now = time.time()
+        with self.lock:
+            reset, used = self.windows.get(token, (0, 0))
+            if now >= reset:
+                reset, used = int(now) + self.config.rate_window, 0
+            used += 1
+            self.windows[token] = (reset, used)
+        remaining = max(0, self.config.rate_limit - used)
+        return used <= self.config.rate_limit, remaining, reset
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this every response
+    # waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_safely('GET')
+
+    def do_POST(self):
+        self.handle_safely('POST')
+
+    def do_PUT(self):
+        self.handle_safely('PUT')
+
+    def do_DELETE(self):
+        self.handle_safely('DELETE')
+
+    def handle_safely(self, method):
+        try:
+            self.handle_api(method)
+        except Exception as e:
+            self.reply(500, {'error': 'Fake server failed: %r' % e,
+                             'status': '500'}, {})
+
+    def handle_api(self, method):
+        config = self.server.config
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if config.latency or config.jitter:
+            time.sleep(max(0.0, config.latency +
+                           random.uniform(-config.jitter, config.jitter)))
+
+        token = self.headers.get('Authorization', '')
+        # Echoed so that clients can check they got their own answer
+        headers = {'x-fake-request': '%s %s' % (method, self.path),
+                   'x-fake-token': token}
+        if config.rate_limit is not None:
+            allowed, remaining, reset = self.server.rate_limits.take(token)
+            headers['x-rate-limit-remaining'] = str(remaining)
+            headers['x-rate-limit-reset'] = str(reset)
+            if not allowed:
+                headers['retry-after'] = str(config.retry_after)
+                return self.reply(429, {'error': 'Rate limit exceeded',
+                                        'status': '429'}, headers)
+        if config.error_rate and random.random() < config.error_rate:
+            return self.reply(500, {'error': 'Internal server error',
+                                    'status': '500'}, headers)
+
+        url = urlparse(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        for route_method, pattern, payload_type, is_list, owner in _ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                break
+        else:
+            return self.reply(404, {'error': 'Not found', 'status': '404'},
+                              headers)
+
+        variables = match.groupdict()
+        if payload_type is None:
+            return self.reply(204, None, headers)
+        if is_list:
+            body = self.page(payload_type, owner, variables, query)
+        else:
+            item_id = _int(next(iter(variables.values()), None), 1)
+            if payload_type == 'account':
+                body = payloads.account(item_id, detailed=True)
+                body['id'] = item_id
+            else:
+                body = payloads.PAYLOADS[payload_type][0](item_id)
+        self.reply(200, body, headers)
+
+    def page(self, payload_type, owner, variables, query):
+        config = self.server.config
+        page = int(query.get('page', 1))
+        per_page = int(query.get('per_page', 25))
+        start = (page - 1) * per_page
+        count = max(0, min(per_page, config.records - start))
+        body = payloads.list_payload(payload_type, count, start)
+        if owner is not None:
+            owner_id = _int(variables[owner], variables[owner])
+            container = payloads.PAYLOADS[payload_type][1]
+            for item in body[container]:
+                item[owner] = owner_id
+        if payload_type == 'request' and 'request_id' in variables:
+            for item in body:
+                item['id'] = _int(variables['request_id'], item['id'])
+        return body
+
+    def reply(self, status, body, headers):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """Threaded fake RingPlus server.
+
+    Use it in a background thread (start/stop) or in a separate process
+    (start_process) so that clients measuring throughput in the same
+    interpreter do not compete with it for the GIL.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, config=None):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.config = config or Config()
+        self.rate_limits = _RateLimits(self.config)
+        self._thread = None
+
+    @property
+    def host(self):
+        """Value for API(host=...)."""
+        return '127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _serve(port, config, ready):
+    server = FakeServer(port, config)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_process(config=None, port=0):
+    """Run a FakeServer in a child process.
+
+    Returns:
+        (process, host): Terminate the process when done.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve,
+                                      args=(port, config or Config(), ready))
+    process.daemon = True
+    process.start()
+    return process, '127.0.0.1:%d' % ready.get(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=None)
+    parser.add_argument('--rate-window', type=int, default=60)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--records', type=int, default=500)
+    args = parser.parse_args()
+    config = Config(args.latency, args.jitter, args.error_rate,
+                    args.rate_limit, args.rate_window, args.retry_after,
+                    args.records)
+    server = FakeServer(args.port, config)
+    print('Fake RingPlus API listening on http://%s' % server.host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
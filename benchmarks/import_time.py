@@ -0,0 +1,66 @@
+"""Check the cost of ``import ringplus`` against a budget.
+
+Usage:
+    python benchmarks/import_time.py [--budget-ms 60] [--runs 5]
+
+Runs ``python -X importtime -c "import ringplus"`` in fresh interpreters,
+reports the cumulative import time of the package and its slowest
+dependencies, and exits with status 1 if the median exceeds the budget or
+if any dependency that should load lazily was imported.
+"""
+
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+
+# Only needed once a request is sent or a user authenticates.
+LAZY_MODULES = ('requests', 'requests_oauthlib', 'oauthlib', 'bs4', 'urllib3')
+
+
+def measure():
+    """Return {module: cumulative microseconds} for one fresh import."""
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ringplus'],
+        stderr=subprocess.STDOUT).decode('utf-8')
+    timings = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=60.0)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = sorted(run['ringplus'] / 1000.0 for run in runs)
+    median = totals[len(totals) // 2]
+
+    last = runs[-1]
+    print('import ringplus: median %.1fms over %d runs (budget %.1fms)'
+          % (median, args.runs, args.budget_ms))
+    slowest = sorted(((t, name) for name, t in last.items()
+                      if name.startswith('ringplus')), reverse=True)
+    for t, name in slowest[:8]:
+        print('  %8.1fms  %s' % (t / 1000.0, name))
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in last]
+    if eager:
+        print('FAIL: imported eagerly: %s' % ', '.join(eager))
+        failed = True
+    if median > args.budget_ms:
+        print('FAIL: import time over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
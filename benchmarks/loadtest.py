@@ -0,0 +1,208 @@
+"""Load test of the client against the local fake RingPlus server.
+
+Usage:
+    python benchmarks/loadtest.py --clients 32 --duration 30
+    python benchmarks/loadtest.py --clients 64 --latency 0.05 \\
+        --error-rate 0.02 --rate-limit 600 --retry-count 3
+
+Starts fakeserver.py in a child process (or uses --host), then runs
+--clients threads calling a weighted mix of endpoints through API for
+--duration seconds. Every call goes through the full client path:
+building the request, auth headers, retries, 429 handling with
+retry-after and parsing into models. The report gives throughput and
+p50/p95/p99 latency per endpoint and overall, and the errors seen.
+
+By default every client has its own API, pass --shared-api to drive all
+clients through one. --tokens spreads the clients over that many access
+tokens, each with its own server side rate limit.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import random
+import sys
+import threading
+import time
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import fakeserver  # noqa: E402
+
+from ringplus.api import API  # noqa: E402
+from ringplus.error import RingPlusError  # noqa: E402
+
+# name -> (weight, function(api, rng, options) making one call)
+WORKLOAD = collections.OrderedDict([
+    ('calls', (30, lambda api, rng, kw: api.calls(
+        account_id=rng.randint(1, 1000), page=rng.randint(1, 4),
+        per_page=100, **kw))),
+    ('texts', (15, lambda api, rng, kw: api.texts(
+        account_id=rng.randint(1, 1000), page=rng.randint(1, 4),
+        per_page=100, **kw))),
+    ('data', (10, lambda api, rng, kw: api.data(
+        account_id=rng.randint(1, 1000), per_page=100, **kw))),
+    ('voicemail', (10, lambda api, rng, kw: api.voicemail(
+        voicemail_box_id=rng.randint(1, 1000), **kw))),
+    ('get_account', (15, lambda api, rng, kw: api.get_account(
+        account_id=rng.randint(1, 1000), **kw))),
+    ('user_accounts', (10, lambda api, rng, kw: api.user_accounts(
+        user_id=rng.randint(1, 100), **kw))),
+    ('update_account', (5, lambda api, rng, kw: api.update_account(
+        account_id=rng.randint(1, 1000), name='Load test', **kw))),
+    ('delete_voicemail', (5, lambda api, rng, kw: api.delete_voicemail(
+        voicemail_message_id=rng.randint(1, 10 ** 6), **kw))),
+])
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+class Results(object):
+    """Latencies and errors collected by the clients."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def add(self, name, latency, error=None):
+        with self.lock:
+            self.latencies[name].append(latency)
+            if error is not None:
+                self.errors['%s: %s' % (name, error)] += 1
+
+
+def _error_name(error):
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return 'HTTP %s' % response.status_code
+    return type(error).__name__
+
+
+def client(api, seed, options, deadline, results):
+    rng = random.Random(seed)
+    names = list(WORKLOAD)
+    weights = [WORKLOAD[name][0] for name in names]
+    kw = {}
+    if options['token'] is not None:
+        kw['headers'] = {'Authorization': 'Bearer %s' % options['token']}
+    while time.time() < deadline:
+        name = _choose(rng, names, weights)
+        call = WORKLOAD[name][1]
+        started = time.time()
+        try:
+            call(api, rng, kw)
+        except RingPlusError as e:
+            results.add(name, time.time() - started, _error_name(e))
+        else:
+            results.add(name, time.time() - started)
+
+
+def _choose(rng, names, weights):
+    point = rng.uniform(0, sum(weights))
+    for name, weight in zip(names, weights):
+        point -= weight
+        if point <= 0:
+            return name
+    return names[-1]
+
+
+def report(results, elapsed):
+    print('%-18s %9s %9s %9s %9s %9s' % ('endpoint', 'requests', 'req/s',
+                                         'p50 ms', 'p95 ms', 'p99 ms'))
+    everything = []
+    for name in WORKLOAD:
+        latencies = sorted(results.latencies.get(name, []))
+        everything.extend(latencies)
+        _row(name, latencies, elapsed)
+    _row('total', sorted(everything), elapsed)
+    if results.errors:
+        print('\nerrors:')
+        for error, count in results.errors.most_common():
+            print('  %6d  %s' % (count, error))
+
+
+def _row(name, latencies, elapsed):
+    print('%-18s %9d %9.1f %9.1f %9.1f %9.1f' % (
+        name, len(latencies), len(latencies) / elapsed,
+        percentile(latencies, 0.50) * 1000,
+        percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--shared-api', action='store_true',
+                        help='drive every client through one API')
+    parser.add_argument('--tokens', type=int, default=0,
+                        help='access tokens the clients are spread over')
+    parser.add_argument('--host', default=None,
+                        help='use a running fake server instead of '
+                             'starting one')
+    parser.add_argument('--retry-count', type=int, default=0)
+    parser.add_argument('--retry-delay', type=float, default=0.1)
+    parser.add_argument('--no-wait-on-rate-limit', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=None)
+    parser.add_argument('--rate-window', type=int, default=60)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--records', type=int, default=500)
+    args = parser.parse_args()
+
+    process = None
+    host = args.host
+    if host is None:
+        config = fakeserver.Config(args.latency, args.jitter,
+                                   args.error_rate, args.rate_limit,
+                                   args.rate_window, args.retry_after,
+                                   args.records)
+        process, host = fakeserver.start_process(config)
+
+    def make_api():
+        return API(host=host, scheme='http', retry_count=args.retry_count,
+                   retry_delay=args.retry_delay,
+                   wait_on_rate_limit=not args.no_wait_on_rate_limit)
+
+    shared = make_api() if args.shared_api else None
+    results = Results()
+    deadline = time.time() + args.duration
+    threads = []
+    started = time.time()
+    for i in range(args.clients):
+        options = {'token': 'token-%d' % (i % args.tokens)
+                   if args.tokens else None}
+        thread = threading.Thread(target=client, args=(
+            shared or make_api(), i, options, deadline, results))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    if process is not None:
+        process.terminate()
+    print('%d clients%s for %.1fs against %s\n' % (
+        args.clients, ' sharing one API' if args.shared_api else '',
+        elapsed, host))
+    report(results, elapsed)
+    if not any(results.latencies.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
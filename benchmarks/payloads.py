@@ -0,0 +1,152 @@
+"""Synthetic RingPlus response payloads for offline benchmarks.
+
+Each generator returns a JSON-ready object shaped like the corresponding
+API response, for every payload_type of ringplus.models.ModelFactory.
+The data is deterministic for a given size.
+"""
+
+from __future__ import print_function
+
+import datetime
+import json
+import os
+
+_EPOCH = datetime.datetime(2016, 1, 1)
+
+
+def _time(i, field='seconds'):
+    return (_EPOCH + datetime.timedelta(**{field: i})).isoformat() + 'Z'
+
+
+def account(i, detailed=False):
+    data = {'id': 1000 + i,
+            'user_id': 10 + i % 7,
+            'name': 'Account %d' % i,
+            'email_address': 'account%d@example.com' % i,
+            'phone_number': '555%07d' % i,
+            'balance': 12.5 + i,
+            'registered_on': _time(i, 'days')}
+    if detailed:
+        data.update({
+            'account_services': [account_service(j) for j in range(3)],
+            'active_device': active_device(i),
+            'voicemail_box': voicemailbox(i),
+            'billing_subscriptions': [billing_subscription(j)
+                                      for j in range(2)],
+        })
+    return data
+
+
+def account_service(i):
+    return {'id': i, 'name': 'Service %d' % i, 'status': 'active'}
+
+
+def active_device(i):
+    return {'id': i, 'esn': 'ESN%010d' % i, 'iccid': 'ICCID%015d' % i,
+            'model': 'Phone', 'registered_on': _time(i, 'days')}
+
+
+def voicemailbox(i):
+    return {'id': 500 + i, 'new_messages': i % 3}
+
+
+def billing_subscription(i):
+    return {'id': i, 'plan_name': 'Plan %d' % i, 'amount': 9.99,
+            'start_date': _time(i, 'days'), 'end_date': _time(i + 30, 'days'),
+            'created_at': _time(i, 'days')}
+
+
+def user(i):
+    return {'id': 10 + i, 'email': 'user%d@example.com' % i,
+            'registered_on': _time(i, 'days'),
+            'shipping_addresses': [],
+            'accounts': [account(i * 3 + j) for j in range(3)]}
+
+
+def call(i):
+    return {'id': i, 'start_time': _time(i * 37), 'duration': i % 600,
+            'number': '555%07d' % (i % 10 ** 7),
+            'call_type': 'outgoing' if i % 2 else 'incoming',
+            'minutes': i % 600 // 60 + 1}
+
+
+def text(i):
+    return {'id': i, 'occurred_at': _time(i * 11),
+            'number': '555%07d' % (i % 10 ** 7),
+            'text_type': 'outgoing' if i % 2 else 'incoming'}
+
+
+def data(i):
+    return {'id': i, 'occurred_at': _time(i * 60), 'kilobytes': i % 4096}
+
+
+def voicemail(i):
+    return {'id': i, 'received_on': _time(i * 600),
+            'caller_id': '555%07d' % (i % 10 ** 7), 'duration': i % 120,
+            'transcription': 'Please call me back about message %d.' % i,
+            'is_new': bool(i % 2)}
+
+
+def request(i):
+    return {'id': i, 'status': 'completed', 'requested_on': _time(i),
+            'account': account(i)}
+
+
+def fluidcall(i):
+    return {'id': i, 'username': 'sip%d' % i, 'password': 'secret',
+            'created_at': _time(i), 'updated_at': _time(i + 1)}
+
+
+def carrier_service(i):
+    return {'id': i, 'name': 'Carrier service %d' % i}
+
+
+# payload_type -> (item generator, container key of the list response)
+PAYLOADS = {
+    'user': (user, 'users'),
+    'account': (account, 'accounts'),
+    'voicemail': (voicemail, 'voicemail_messages'),
+    'call': (call, 'phone_calls'),
+    'text': (text, 'phone_texts'),
+    'data': (data, 'phone_data'),
+    'request': (request, None),
+    'voicemailbox': (voicemailbox, None),
+    'active_device': (active_device, None),
+    'account_service': (account_service, None),
+    'billing_subscription': (billing_subscription, None),
+    'fluidcall': (fluidcall, 'fluidcall_credentials'),
+    'carrier_service': (carrier_service, 'enforced_carrier_services'),
+    'json': (account, None),
+    'id': (lambda i: i, 'ids'),
+}
+
+
+def items(payload_type, count, start=0):
+    """Return count items of a payload type."""
+    generator = PAYLOADS[payload_type][0]
+    return [generator(i) for i in range(start, start + count)]
+
+
+def list_payload(payload_type, count, start=0):
+    """Return a list response, wrapped in its container if it has one."""
+    container = PAYLOADS[payload_type][1]
+    result = items(payload_type, count, start)
+    return {container: result} if container else result
+
+
+def body(payload):
+    """Serialize a payload the way the API sends it."""
+    return json.dumps(payload)
+
+
+def recorded(directory, payload_type):
+    """Return the body recorded for a payload type, or None.
+
+    Recorded bodies are files named <payload_type>.json, for instance real
+    responses saved from the API with sensitive values scrubbed.
+    """
+    path = os.path.join(directory, payload_type + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
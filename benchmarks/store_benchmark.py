@@ -0,0 +1,88 @@
+"""Benchmark UsageStore ingest throughput and query latency.
+
+Usage:
+    python benchmarks/store_benchmark.py --rows 10000000 --db /tmp/usage.db
+
+Synthetic call records are spread over a number of accounts and ingested in
+bulk transactions. The script then runs date range queries mirroring
+API.calls against random accounts and prints latency percentiles.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from ringplus.store import UsageStore  # noqa: E402
+
+
+def synthetic_calls(account_index, count, start):
+    for i in range(count):
+        occurred = start + datetime.timedelta(seconds=i * 37)
+        yield {'id': account_index * 10 ** 9 + i,
+               'start_time': occurred.isoformat() + 'Z',
+               'duration': i % 600,
+               'number': '555%07d' % ((account_index * 7919 + i) % 10 ** 7),
+               'call_type': 'outgoing' if i % 2 else 'incoming'}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10 * 1000 * 1000)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--db', default=None,
+                        help='database path (default: a temporary file)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'usage.db')
+    store = UsageStore(path)
+    start = datetime.datetime(2016, 1, 1)
+    per_account = args.rows // args.accounts
+
+    began = time.time()
+    written = 0
+    for account_index in range(args.accounts):
+        written += store.ingest('calls', account_index,
+                                synthetic_calls(account_index, per_account,
+                                                start),
+                                batch_size=args.batch_size)
+    elapsed = time.time() - began
+    print('ingested %d rows in %.1fs (%.0f rows/sec)'
+          % (written, elapsed, written / elapsed))
+
+    span = datetime.timedelta(seconds=per_account * 37)
+    latencies = []
+    for _ in range(args.queries):
+        account_id = random.randrange(args.accounts)
+        begin = start + datetime.timedelta(
+            seconds=random.random() * span.total_seconds())
+        t0 = time.time()
+        store.calls(account_id, start_date=begin,
+                    end_date=begin + datetime.timedelta(days=7), per_page=25)
+        latencies.append((time.time() - t0) * 1000)
+
+    print('calls() query latency over %d queries: p50 %.2fms p95 %.2fms '
+          'p99 %.2fms' % (len(latencies), percentile(latencies, 0.50),
+                          percentile(latencies, 0.95),
+                          percentile(latencies, 0.99)))
+    print('database: %s (%.1f MB)' % (path, os.path.getsize(path) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Stress test of one API shared by many threads.
+
+Usage:
+    python benchmarks/stress_threads.py                  # 64 threads
+    python benchmarks/stress_threads.py --threads 128 --calls 500
+
+Every thread calls a mix of endpoints through the same API against the
+fake server (fakeserver.py), each with its own parameters and its own
+Authorization header, and checks that what it got back belongs to its
+own call:
+
+- the records carry the account_id or voicemail_box_id it asked for, and
+  the page it asked for
+- api.last_response is the response to its call: the server echoes the
+  request line and the Authorization header of every request
+- method.response of calls made with create=True is its own too
+
+Errors count as mismatches too. The script reports them and exits with
+status 1 if there is any.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import random
+import sys
+import threading
+import time
+
+# Run from a checkout without installing ringplus
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import fakeserver  # noqa: E402
+
+from ringplus.api import API  # noqa: E402
+
+PER_PAGE = 20
+
+
+def _records(result, field, expected):
+    for record in result:
+        if getattr(record, field) != expected:
+            return '%s %r != %r' % (field, getattr(record, field), expected)
+
+
+def check_usage(api, rng, headers, kind):
+    account_id = rng.randint(1, 10 ** 6)
+    page = rng.randint(1, 5)
+    result = getattr(api, kind)(account_id=account_id, page=page,
+                                per_page=PER_PAGE, headers=headers)
+    expected = 'GET /accounts/%d/phone_%s?' % (
+        account_id, 'data' if kind == 'data' else kind)
+    return (_records(result, 'account_id', account_id) or
+            _first_id(result, (page - 1) * PER_PAGE),
+            expected)
+
+
+def _first_id(result, expected):
+    if result and result[0].id != expected:
+        return 'first id %r != %r' % (result[0].id, expected)
+
+
+def check_voicemail(api, rng, headers, kind):
+    box_id = rng.randint(1, 10 ** 6)
+    result = api.voicemail(voicemail_box_id=box_id, per_page=PER_PAGE,
+                           headers=headers)
+    return (_records(result, 'voicemail_box_id', box_id),
+            'GET /voicemail_boxes/%d/voicemail_messages?' % box_id)
+
+
+def check_account(api, rng, headers, kind):
+    account_id = rng.randint(1, 10 ** 6)
+    account = api.get_account(account_id=account_id, headers=headers)
+    mismatch = None
+    if account.id != account_id:
+        mismatch = 'account id %r != %r' % (account.id, account_id)
+    return mismatch, 'GET /accounts/%d?' % account_id
+
+
+def check_user(api, rng, headers, kind):
+    # Larger ids give synthetic dates past year 9999
+    user_id = rng.randint(1, 10 ** 5)
+    user = api.get_user(user_id=user_id, headers=headers)
+    mismatch = None
+    if user.id != 10 + user_id:
+        mismatch = 'user id %r != %r' % (user.id, 10 + user_id)
+    return mismatch, 'GET /users/%d?' % user_id
+
+
+def check_update(api, rng, headers, kind):
+    account_id = rng.randint(1, 10 ** 6)
+    api.update_account(account_id=account_id, name='Stress %d' % account_id,
+                       headers=headers)
+    return None, 'PUT /accounts/%d?' % account_id
+
+
+def check_created(api, rng, headers, kind):
+    account_id = rng.randint(1, 10 ** 6)
+    method = api.calls(account_id=account_id, per_page=PER_PAGE,
+                       headers=headers, create=True)
+    result = method.execute()
+    line = method.response.headers.get('x-fake-request', '')
+    mismatch = _records(result, 'account_id', account_id)
+    if not line.startswith('GET /accounts/%d/phone_calls?' % account_id):
+        mismatch = 'method.response is for %r' % line
+    return mismatch, 'GET /accounts/%d/phone_calls?' % account_id
+
+
+CHECKS = [
+    ('calls', check_usage),
+    ('texts', check_usage),
+    ('data', check_usage),
+    ('voicemail', check_voicemail),
+    ('get_account', check_account),
+    ('get_user', check_user),
+    ('update_account', check_update),
+    ('create', check_created),
+]
+
+
+def worker(api, index, calls, barrier, results):
+    rng = random.Random(index)
+    token = 'Bearer thread-%d' % index
+    headers = {'Authorization': token}
+    barrier.wait()
+    for _ in range(calls):
+        kind, check = rng.choice(CHECKS)
+        try:
+            mismatch, expected = check(api, rng, headers, kind)
+        except Exception as e:
+            results.add(kind, 'error: %r' % e)
+            continue
+        response = api.last_response
+        line = response.headers.get('x-fake-request', '')
+        # Path variables are sent as parameters as well, so there is
+        # always a query string, whose order is up to requests
+        if not line.startswith(expected):
+            mismatch = mismatch or \
+                'last_response is for %r, expected %r' % (line, expected)
+        if response.headers.get('x-fake-token') != token:
+            mismatch = mismatch or 'sent token %r, expected %r' % (
+                response.headers.get('x-fake-token'), token)
+        results.add(kind, mismatch)
+
+
+class Results(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.mismatches = []
+
+    def add(self, kind, mismatch):
+        with self.lock:
+            self.calls[kind] += 1
+            if mismatch:
+                self.mismatches.append((kind, mismatch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--calls', type=int, default=200,
+                        help='calls per thread (default 200)')
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--jitter', type=float, default=0.005)
+    args = parser.parse_args()
+
+    config = fakeserver.Config(latency=args.latency, jitter=args.jitter,
+                               records=PER_PAGE * 5)
+    process, host = fakeserver.start_process(config)
+    api = API(host=host, scheme='http', pool_size=args.threads)
+    results = Results()
+    barrier = threading.Barrier(args.threads)
+    threads = [threading.Thread(target=worker, args=(
+        api, i, args.calls, barrier, results)) for i in range(args.threads)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    process.terminate()
+
+    total = sum(results.calls.values())
+    print('%d threads sharing one API made %d calls in %.1fs (%.0f/s)' % (
+        args.threads, total, elapsed, total / elapsed))
+    for kind, count in sorted(results.calls.items()):
+        print('  %-16s %6d' % (kind, count))
+    if results.mismatches:
+        print('FAIL: %d calls got another call\'s data:'
+              % len(results.mismatches))
+        for kind, mismatch in results.mismatches[:20]:
+            print('  %s: %s' % (kind, mismatch))
+        sys.exit(1)
+    print('OK: no cross-talk')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ __license__ = 'MIT'
 from ringplus.models import User, Account
 from ringplus.error import RingPlusError, RateLimitError
 from ringplus.api import API
-from ringplus.auth import OAuthHandler
+from ringplus.auth import OAuthHandler, TokenRegistry
 
 
 def debug(enable=True, level=1):
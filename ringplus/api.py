@@ -2,8 +2,12 @@
 
 from __future__ import print_function
 
+import threading
+
 from ringplus.parsers import ModelParser
 from ringplus.binder import bind_api
+from ringplus.error import RingPlusError
+from ringplus.ratelimit import RateLimit
 
 
 class API(object):
@@ -17,12 +21,15 @@ class API(object):
                  parser=None, version='1', retry_count=0, retry_delay=0,
                  retry_errors=None, timeout=60,
                  wait_on_rate_limit=False, wait_on_rate_limit_notify=False,
-                 proxy=''):
+                 proxy='', rate_budget=None, scheme='https',
+                 metrics=None, transport=None, pool_size=10):
         """API instance constructor.
 
         Args:
             auth_handler: The OAutherHandler from to use to retreive the
-                authorization token.
+                authorization token. A TokenRegistry can be given instead
+                to make calls for many users, each call then names its
+                user with the identity keyword argument.
             host:  url of the server of the rest api.
                 default:'api.ringplus.net'
             cache: Cache to query if a GET method is used.
@@ -40,6 +47,17 @@ class API(object):
             wait_on_rate_limit_notify: If the api print a notification when
                 the rate limit is hit. default:False
             proxy: Url to use as proxy during the HTTP request. default:''
+            rate_budget: A ringplus.ratelimit.RateBudget every request made
+                through this instance must take a token from. default:None
+            scheme: URL scheme, 'http' is only meant for local test
+                servers. default:'https'
+            metrics: A ringplus.metrics.Metrics recording every request
+                made through this instance. default:None
+            transport: Object with the request() method of
+                requests.Session sending the calls instead of session,
+                see ringplus.transport. default:None
+            pool_size: Connections kept open to the host. Raise it to the
+                number of threads sharing this instance. default:10
         """
 
         self.auth = auth_handler
@@ -50,10 +68,128 @@ class API(object):
         self.retry_count = retry_count
         self.retry_delay = retry_delay
         self.retry_errors = retry_errors
-        self.timeout = 60
+        self.timeout = timeout
         self.wait_on_rate_limit = wait_on_rate_limit
         self.wait_on_rate_limit_notify = wait_on_rate_limit_notify
         self.proxy = proxy
+        self.rate_budget = rate_budget
+        self.scheme = scheme
+        self.metrics = metrics
+        self.transport = transport
+        self.pool_size = pool_size
+        # Listeners of call events, created by on()
+        self.hooks = None
+        # Shared by all calls so connections are pooled, see session
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Rate limit of the auth handler's token
+        self.rate_limit = RateLimit()
+        # Outcome of the last call, per thread, see last_response
+        self._local = threading.local()
+        # Identity -> lock held while resolving the ids of its token, so
+        # identities resolve concurrently and each one once, see
+        # get_user_id
+        self._ids_locks = {}
+        self._ids_lock = threading.Lock()
+
+    @property
+    def last_response(self):
+        """Response of the last call made by the current thread.
+
+        Calls made by other threads through the same API do not change it.
+        A call made with create=True keeps its own in method.response.
+        """
+        return getattr(self._local, 'last_response', None)
+
+    @last_response.setter
+    def last_response(self, response):
+        self._local.last_response = response
+
+    @property
+    def cached_result(self):
+        """Whether the last call of the current thread hit the cache."""
+        return getattr(self._local, 'cached_result', False)
+
+    @cached_result.setter
+    def cached_result(self, cached):
+        self._local.cached_result = cached
+
+    @property
+    def session(self):
+        """The requests.Session shared by all calls.
+
+        Created on first use so that requests is only imported once a call
+        is actually made.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def get_user_id(self, identity=None):
+        """Return the id of the user the access token belongs to.
+
+        The first call makes a users(per_page=1) request; the auth handler
+        then keeps the ids until its token changes, so the {user_id} and
+        {account_id} of calls made without them cost nothing.
+        """
+        return self._resolve_ids(identity)[0]
+
+    def get_account_id(self, identity=None):
+        """Return the id of the default account of the access token's
+        user, its first account. See get_user_id."""
+        account_id = self._resolve_ids(identity)[1]
+        if account_id is None:
+            raise RingPlusError('The user of the access token has no '
+                                'account')
+        return account_id
+
+    def _resolve_ids(self, identity):
+        if self.auth is None:
+            raise RingPlusError('An auth handler is required to resolve '
+                                'the user of the access token')
+        ids = self.auth.get_ids(identity)
+        if ids is not None:
+            return ids
+        with self._ids_lock:
+            lock = self._ids_locks.setdefault(identity, threading.Lock())
+        with lock:
+            ids = self.auth.get_ids(identity)
+            if ids is None:
+                users = self.users(per_page=1, identity=identity,
+                                   use_cache=False)
+                if not users:
+                    raise RingPlusError('No user found for the access token')
+                accounts = getattr(users[0], 'accounts', None)
+                ids = (users[0].id, accounts[0].id if accounts else None)
+                self.auth.set_ids(ids[0], ids[1], identity)
+        return ids
+
+    def on(self, event, callback):
+        """Call callback with the Event every time a call emits event.
+
+        See ringplus.hooks.EVENTS for the events.
+        """
+        if self.hooks is None:
+            from ringplus.hooks import Hooks
+            self.hooks = Hooks()
+        self.hooks.add(event, callback)
+
+    def off(self, event, callback):
+        """Stop calling callback for event."""
+        if self.hooks is not None:
+            self.hooks.remove(event, callback)
 
     # Accounts
     @property
@@ -78,6 +214,11 @@ class API(object):
                 Default to 1.
             per_page (optional): How many results to return per page.
                 Defaults to 25.
+            expand (optional): Fetch the detailed object of every account
+                with API.get_account, concurrently, and update the
+                accounts with it. Defaults to False.
+            expand_workers (optional): Detail calls running at once.
+                Defaults to 8.
 
         Returns
             list: List of Account objects
@@ -89,7 +230,8 @@ class API(object):
             payload_list=True,
             allowed_param=['user_id', 'name', 'email_address',
                            'phone_number', 'device_esn', 'device_iccid',
-                           'page', 'per_page'])
+                           'page', 'per_page'],
+            expand='get_account')
 
     @property
     def accounts(self):
@@ -112,6 +254,11 @@ class API(object):
                 Default to 1.
             per_page (optional): How many results to return per page.
                 Defaults to 25.
+            expand (optional): Fetch the detailed object of every account
+                with API.get_account, concurrently, and update the
+                accounts with it. Defaults to False.
+            expand_workers (optional): Detail calls running at once.
+                Defaults to 8.
 
         Returns
             list: List of Account objects
@@ -123,7 +270,8 @@ class API(object):
             payload_list=True,
             allowed_param=['name', 'email_address', 'phone_number',
                            'device_esn', 'device_iccid', 'page',
-                           'per_page'])
+                           'per_page'],
+            expand='get_account')
 
     @property
     def get_account(self):
@@ -2,10 +2,17 @@
 
 from __future__ import print_function
 
-import requests
-from requests_oauthlib import OAuth2, OAuth2Session
+import logging
+import threading
+import time
 
-from bs4 import BeautifulSoup
+# requests, requests_oauthlib and bs4 are imported where they are used, so
+# importing ringplus stays cheap for processes that never authenticate.
+
+from ringplus.error import RingPlusError
+from ringplus.ratelimit import RateLimit
+
+log = logging.getLogger('ringplus.auth')
 
 
 class OAuthHandler(object):
@@ -30,19 +37,48 @@ class OAuthHandler(object):
     AUTHORIZATION_BASE_URL = 'https://my.ringplus.net/oauth/authorize'
     TOKEN_URL = 'https://my.ringplus.net/oauth/token'
 
-    def __init__(self, client_id, client_secret, redirect_uri):
+    # Seconds to wait before trying again after a failed refresh
+    REFRESH_RETRY_DELAY = 30
+
+    def __init__(self, client_id, client_secret, redirect_uri,
+                 refresh_margin=300, token_store=None):
         """OAuthHandler instance contructor.
 
         Args:
             client_id: Client ID associated with the app.
             client_secret: Client secret.
             redirect_uri: The redirect URI exactly as listed on RingPlus.
+            refresh_margin: Seconds before the token expires at which it is
+                refreshed in the background. None disables automatic
+                refreshing. default: 300
+            token_store: A ringplus.tokenstore.TokenStore used to persist
+                tokens, so later processes can skip the login; see
+                restore. default: None
         """
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.access_token = None
-        self.oauth = OAuth2Session(client_id, redirect_uri=redirect_uri)
+        self.refresh_margin = refresh_margin
+        self.token_store = token_store
+        self._token_key = client_id
+        self._oauth = None
+        # (token, OAuth2) pair so the auth object is built once per token
+        self._auth = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self._next_refresh_attempt = 0
+        # (access token, user id, account id) of the token, see set_ids
+        self._ids = None
+
+    @property
+    def oauth(self):
+        """The OAuth2Session used for the authorization code flow."""
+        if self._oauth is None:
+            from requests_oauthlib import OAuth2Session
+            self._oauth = OAuth2Session(self.client_id,
+                                        redirect_uri=self.redirect_uri)
+        return self._oauth
 
     def get_authorization_url(self, **kwargs):
         """Returns the authorization URL to redirect users."""
@@ -61,26 +97,41 @@ class OAuthHandler(object):
             self.TOKEN_URL,
             authorization_response=authorization_response,
             client_secret=self.client_secret)
+        self._save_token(token)
         return token
 
     def refresh_token(self):
         """Refresh the current access token."""
-        data = {'grant_type': 'refresh_token',
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'refresh_token': self.access_token['refresh_token']}
-        post = requests.post(self.TOKEN_URL, data=data)
-        self.access_token = post.json()
+        stored = self._load_token()
+        if stored and not self._expiring(stored) and \
+                stored.get('access_token') != self.access_token.get(
+                    'access_token'):
+            # Another process already refreshed it.
+            self.access_token = stored
+            return
+        self.access_token = _refresh_token(self.TOKEN_URL, self.client_id,
+                                           self.client_secret,
+                                           self.access_token)
+        self._save_token(self.access_token)
 
     def login(self, username, password, **kwargs):
         """Hackish method to sign into RingPlus without going to site.
 
         This sets the access token for the OAutherHandler instance.
 
+        If a token store is configured, a usable token saved by an earlier
+        login is loaded instead, after refreshing it if it is about to
+        expire. The scripted login only runs when there is none.
+
         Args:
             username: Username used to login to Ring Plus (likely your email).
             password: The password used to login to Ring Plus.
         """
+        self._token_key = '%s:%s' % (self.client_id, username)
+        if self._restore_token():
+            return
+
+        import requests
         session = requests.Session()
         params = {'response_type': 'code',
                   'client_id': self.client_id,
@@ -96,19 +147,144 @@ class OAuthHandler(object):
 
         self.access_token = self.fetch_token(r2.url)
 
+    def restore(self, username=None):
+        """Load a usable token saved in the token store.
+
+        Tokens saved by fetch_token, e.g. by the redirect flow, are found
+        without a username; tokens saved by login are found with the
+        username given to it. A token about to expire is refreshed.
+
+        Returns:
+            bool: Whether a usable token was loaded.
+        """
+        if self.token_store is None:
+            raise RingPlusError('restore requires a token_store')
+        self._token_key = self.client_id if username is None else \
+            '%s:%s' % (self.client_id, username)
+        if self._restore_token():
+            return True
+        self.access_token = None
+        return False
+
+    def _restore_token(self):
+        """Load a usable token from the token store, if there is one."""
+        token = self._load_token()
+        if not token:
+            return False
+        self.access_token = token
+        if not self._expiring(token):
+            return True
+        if not token.get('refresh_token'):
+            return False
+        try:
+            self.refresh_token()
+        except Exception as e:
+            log.warning('Failed to refresh stored token: %s', e)
+            return False
+        return True
+
+    def _expiring(self, token):
+        expires_at = token.get('expires_at')
+        if expires_at is None:
+            return False
+        return expires_at - time.time() <= (self.refresh_margin or 0)
+
+    def _load_token(self):
+        if self.token_store is None:
+            return None
+        return self.token_store.load(self._token_key)
+
+    def _save_token(self, token):
+        if self.token_store is not None:
+            self.token_store.save(self._token_key, token)
+
+    def get_ids(self, identity=None):
+        """Return the (user id, account id) of the access token.
+
+        None until set_ids is called, and again once the token is
+        replaced, e.g. refreshed. API.get_user_id resolves them.
+        """
+        ids = self._ids
+        if ids is not None and self.access_token and \
+                ids[0] == self.access_token.get('access_token'):
+            return ids[1:]
+        return None
+
+    def set_ids(self, user_id, account_id, identity=None):
+        """Remember the user and default account of the access token."""
+        if self.access_token:
+            self._ids = (self.access_token.get('access_token'), user_id,
+                         account_id)
+
     def get_account_id(self):
-        """Return the account id associated with the access token."""
-        raise NotImplementedError
+        """Return the account id associated with the access token.
+
+        Raises RingPlusError until resolved, see API.get_account_id.
+        """
+        return self._resolved_ids()[1]
 
     def get_user_id(self):
-        """Return the first user id associated with the access token."""
-        raise NotImplementedError
+        """Return the first user id associated with the access token.
+
+        Raises RingPlusError until resolved, see API.get_user_id.
+        """
+        return self._resolved_ids()[0]
+
+    def _resolved_ids(self):
+        ids = self.get_ids()
+        if ids is None:
+            raise RingPlusError('The ids of the access token are not '
+                                'resolved, use API.get_user_id')
+        return ids
 
     def apply_auth(self):
-        return OAuth2(self.client_id, token=self.access_token)
+        token = self.access_token
+        if self.refresh_margin is not None and token and \
+                token.get('expires_at') and token.get('refresh_token'):
+            remaining = token['expires_at'] - time.time()
+            if remaining <= 0:
+                # Nothing usable left, wait for the new token.
+                self._start_refresh(wait=True)
+                token = self.access_token
+            elif remaining <= self.refresh_margin and \
+                    time.time() >= self._next_refresh_attempt:
+                # Still valid, keep using it while refreshing ahead.
+                self._start_refresh(wait=False)
+
+        cached = self._auth
+        if cached is not None and cached[0] is token:
+            return cached[1]
+        from requests_oauthlib import OAuth2
+        auth = OAuth2(self.client_id, token=token)
+        self._auth = (token, auth)
+        return auth
+
+    def _start_refresh(self, wait):
+        """Refresh the token in a background thread, at most one at once."""
+        with self._refresh_lock:
+            thread = self._refresh_thread
+            if thread is None:
+                thread = threading.Thread(target=self._background_refresh)
+                thread.daemon = True
+                self._refresh_thread = thread
+                thread.start()
+        if wait:
+            thread.join()
+
+    def _background_refresh(self):
+        try:
+            self.refresh_token()
+        except Exception as e:
+            log.warning('Failed to refresh access token: %s', e)
+            self._next_refresh_attempt = time.time() + \
+                self.REFRESH_RETRY_DELAY
+        finally:
+            with self._refresh_lock:
+                self._refresh_thread = None
 
     def _get_input_data_from_html(self, html):
         """Return the params needed to login from html."""
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html, 'html.parser')
         input_tags = soup.find_all('input')
 
@@ -125,3 +301,129 @@ class OAuthHandler(object):
                 data[key] = username
             if 'password' in key:
                 data[key] = password
+
+
+class _Identity(object):
+    """Token state of one identity in a TokenRegistry."""
+
+    __slots__ = ('token', 'auth', 'rate_limit', 'ids')
+
+    def __init__(self, token, rate_limit):
+        self.token = token
+        self.auth = None
+        self.rate_limit = rate_limit
+        # (user id, account id) of the token, see TokenRegistry.set_ids
+        self.ids = None
+
+
+class TokenRegistry(object):
+    """Access tokens of many users for a single application.
+
+    Passing a TokenRegistry as the auth handler of an API lets one API
+    instance, with its connection pool, parser and cache, serve many users.
+    Every call names the identity it is made for::
+
+        registry = TokenRegistry(client_id, client_secret)
+        registry.add('alice', alice_token)
+        api = API(registry)
+        api.accounts(identity='alice')
+
+    Cached results are partitioned by identity and rate limits are tracked
+    per token. Only the token dictionary, a lazily built auth object and the
+    rate limit counters are kept per identity.
+
+    Args:
+        client_id: Client ID associated with the app.
+        client_secret: Client secret.
+    """
+
+    TOKEN_URL = OAuthHandler.TOKEN_URL
+
+    def __init__(self, client_id, client_secret):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._identities = {}
+        self._lock = threading.Lock()
+        # One lock for the rate limits of all identities keeps them small.
+        self._rate_limit_lock = threading.Lock()
+
+    def add(self, identity, token):
+        """Register or replace the access token of an identity.
+
+        Args:
+            identity: Any hashable key naming the user.
+            token (dict): Token as returned by OAuthHandler.fetch_token.
+        """
+        with self._lock:
+            entry = self._identities.get(identity)
+            if entry is None:
+                self._identities[identity] = _Identity(
+                    token, RateLimit(self._rate_limit_lock))
+            else:
+                entry.token = token
+                entry.auth = None
+                entry.ids = None
+
+    def remove(self, identity):
+        with self._lock:
+            self._identities.pop(identity, None)
+
+    def __contains__(self, identity):
+        return identity in self._identities
+
+    def get_token(self, identity):
+        return self._entry(identity).token
+
+    def refresh_token(self, identity):
+        """Refresh the access token of an identity."""
+        entry = self._entry(identity)
+        self.add(identity, _refresh_token(self.TOKEN_URL, self.client_id,
+                                          self.client_secret, entry.token))
+
+    def rate_limit(self, identity):
+        """Return the RateLimit of the token of an identity."""
+        return self._entry(identity).rate_limit
+
+    def get_ids(self, identity):
+        """Return the (user id, account id) of the token of an identity,
+        None until set_ids is called or once the token is replaced."""
+        return self._entry(identity).ids
+
+    def set_ids(self, user_id, account_id, identity):
+        self._entry(identity).ids = (user_id, account_id)
+
+    def apply_auth(self, identity=None):
+        entry = self._entry(identity)
+        auth = entry.auth
+        if auth is None:
+            from requests_oauthlib import OAuth2
+            auth = entry.auth = OAuth2(self.client_id, token=entry.token)
+        return auth
+
+    def _entry(self, identity):
+        if identity is None:
+            raise RingPlusError('An identity is required when using a '
+                                'TokenRegistry')
+        try:
+            return self._identities[identity]
+        except KeyError:
+            raise RingPlusError('Unknown identity: %s' % (identity,))
+
+
+def _refresh_token(token_url, client_id, client_secret, token):
+    """Exchange the refresh token of a token for a new token."""
+    import requests
+    data = {'grant_type': 'refresh_token',
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'refresh_token': token['refresh_token']}
+    post = requests.post(token_url, data=data)
+    new_token = post.json()
+    if 'access_token' not in new_token:
+        raise RingPlusError(new_token.get('error_description',
+                                          new_token.get('error', new_token)),
+                            post)
+    if 'expires_in' in new_token and 'expires_at' not in new_token:
+        new_token['expires_at'] = time.time() + float(new_token['expires_in'])
+    new_token.setdefault('refresh_token', token['refresh_token'])
+    return new_token
@@ -2,13 +2,13 @@
 from __future__ import print_function
 
 import re
-import requests
 import time
 import logging
 import datetime
 
-from six.moves.urllib.parse import quote
+from six.moves.urllib.parse import quote, urlencode
 
+from ringplus.auth import TokenRegistry
 from ringplus.utils import convert_to_utf8_str
 from ringplus.error import RingPlusError, RateLimitError
 from ringplus.error import is_rate_limit_error_message
@@ -34,6 +34,9 @@ def bind_api(**config):
         post_container (str): The name of the container to be used when
             using 'POST' or 'PUT' methods. default:None
         use_cache (bool): Where to use cache or not. default:False
+        expand (str): Name of the API method returning the detailed object
+            of a record, called with <payload_type>_id=record.id when the
+            call is made with expand=True. default:None
 
     """
 
@@ -49,10 +52,15 @@ def bind_api(**config):
         # put and post requests, ie params{'account[name']: "John Smith"}
         post_container = config.get('post_container', None)
         use_cache = config.get('use_cache', True)
-        session = requests.Session()
+        expand = config.get('expand', None)
+        # Name of the endpoint in metrics and hook events
+        endpoint = method + ' ' + path
 
         def __init__(self, args, kwargs):
             api = self.api
+            # A transport replaces the session, e.g. to record or replay
+            self.session = api.session if api.transport is None \
+                else api.transport
 
             self.post_data = kwargs.pop('post_data', None)
             self.retry_count = kwargs.pop('retry_count', api.retry_count)
@@ -65,7 +73,22 @@ def bind_api(**config):
                 'wait_on_rate_limit_notify', api.wait_on_rate_limit_notify)
 
             self.parser = kwargs.pop('parser', api.parser)
-            self.session.headers = kwargs.pop('headers', {})
+            self.use_cache = kwargs.pop('use_cache', self.use_cache)
+            # The identity to call as when the auth is a TokenRegistry
+            self.identity = kwargs.pop('identity', None)
+            if self.identity is not None and \
+                    not isinstance(api.auth, TokenRegistry):
+                raise RingPlusError('identity= requires a TokenRegistry')
+            # Copied, the Host and Accept headers are added to it below
+            self.headers = dict(kwargs.pop('headers', None) or {})
+            # Identifies the call in hook events, random by default
+            self.correlation_id = kwargs.pop('correlation_id', None)
+            # Fetch the detailed object of every record, see expand_details
+            expand = kwargs.pop('expand', False)
+            self.expand_workers = kwargs.pop('expand_workers', 8)
+            if expand and self.expand is None:
+                raise RingPlusError('%s has nothing to expand' % self.endpoint)
+            self.expand = self.expand if expand else None
             self.build_parameters(args, kwargs)
 
             # Perform any path variable substitution
@@ -74,17 +97,23 @@ def bind_api(**config):
             self.host = api.host
 
             # Manually set Host header
-            self.session.headers['Host'] = self.host
+            self.headers['Host'] = self.host
             # Set version header
-            self.session.headers['Accept'] = 'application/vnd.ringplus.v{}'.\
+            self.headers['Accept'] = 'application/vnd.ringplus.v{}'.\
                 format(self.api.version)
-            # Monitoring rate limits
-            self._remaining_calls = None
-            self._reset_time = None
+            # Monitoring rate limits, shared by all calls using the token
+            if self.identity is not None:
+                self.rate_limit = api.auth.rate_limit(self.identity)
+            else:
+                self.rate_limit = api.rate_limit
+            # The response of this call and whether it came from the
+            # cache, set by execute
+            self.response = None
+            self.cached_result = False
 
         def build_parameters(self, args, kwargs):
             """Configure the parameters to be sent with the request."""
-            self.session.params = {}
+            self.params = {}
 
             for idx, arg in enumerate(args):
                 if arg is None:
@@ -99,7 +128,7 @@ def bind_api(**config):
                         # Convert to ringplus PUT/POST format
                         if key not in ('account_id', 'user_id'):
                             key = self.post_container + '[{}]'.format(key)
-                    self.session.params[key] = utf8str
+                    self.params[key] = utf8str
                 except IndexError:
                     raise RingPlusError('Too many parameters supplied!')
 
@@ -109,7 +138,7 @@ def bind_api(**config):
                 # convert datetimes to iso 8601 strings
                 if isinstance(arg, datetime.datetime):
                     arg = arg.isoformat()
-                if k in self.session.params:
+                if k in self.params:
                     err = 'Multiple values for parameter %s supplied!' % k
                     raise RingPlusError(err)
 
@@ -118,45 +147,107 @@ def bind_api(**config):
                         # Convert to ringplus PUT/POST format
                         if k not in ('account_id', 'user_id'):
                             k = self.post_container + '[{}]'.format(k)
-                self.session.params[k] = utf8str
+                self.params[k] = utf8str
 
-            log.info("PARAMS: %r", self.session.params)
+            log.info("PARAMS: %r", self.params)
 
         def build_path(self):
             """Make appropriate substitutions to build path."""
             for variable in re_path_template.findall(self.path):
                 name = variable.strip('{}')
 
+                # Ids of the token's user, resolved once per token
                 if name == 'account_id' and \
-                           'account_id' not in self.session.params and \
+                           'account_id' not in self.params and \
                            self.api.auth:
-                    value = self.api.auth.get_account_id()
+                    value = quote(str(self.api.get_account_id(
+                        self.identity)))
                 elif name == 'user_id' and \
-                             'user_id' not in self.session.params and \
+                             'user_id' not in self.params and \
                              self.api.auth:
-                    value = self.api.get_user_id()
+                    value = quote(str(self.api.get_user_id(self.identity)))
                 else:
                     try:
-                        value = quote(self.session.params[name])
+                        value = quote(self.params[name])
                     except KeyError:
                         raise RingPlusError('No parameter value found for '
                                             'path variable: %s' % name)
-                        del self.session.params[name]
+                        del self.params[name]
 
                 self.path = self.path.replace(variable, value)
 
         def execute(self):
             """Make the request."""
-            self.api.cached_result = False
-
             # Build the request URL
             url = self.path
-            full_url = 'https://' + self.host + url
+            full_url = self.api.scheme + '://' + self.host + url
+
+            hooks = self.api.hooks
+            if hooks is None:
+                result = self._execute(full_url, None, None)
+            else:
+                call = hooks.start_call(self, full_url, self.correlation_id)
+                hooks.emit('before_call', call, time.time())
+                try:
+                    result = self._execute(full_url, hooks, call)
+                except Exception as e:
+                    hooks.emit('after_call', call, time.time(), error=e)
+                    raise
+                hooks.emit('after_call', call, time.time(), result=result)
+            if self.expand is not None and result:
+                self.expand_details(result)
+            return result
+
+        def expand_details(self, result):
+            """Replace the fields of the records with their detailed ones.
+
+            The detail calls run concurrently, as the same identity and
+            with the same headers, and go through the cache like any call,
+            so records fetched before cost nothing. The records are
+            updated in place; the first failing detail call is raised once
+            all of them are done.
+            """
+            records = result if isinstance(result, list) else [result]
+            records = [record for record in records
+                       if isinstance(record, Model) and
+                       getattr(record, 'id', None) is not None]
+            if not records:
+                return
+            detail = getattr(self.api, self.expand)
+            id_param = self.payload_type + '_id'
+            headers = dict((k, v) for k, v in self.headers.items()
+                           if k not in ('Host', 'Accept'))
+
+            def fetch(record):
+                kwargs = {id_param: record.id, 'headers': dict(headers)}
+                if self.identity is not None:
+                    kwargs['identity'] = self.identity
+                return detail(**kwargs)
+
+            from concurrent.futures import ThreadPoolExecutor
+            workers = max(1, min(self.expand_workers, len(records)))
+            with ThreadPoolExecutor(workers) as executor:
+                futures = [executor.submit(fetch, record)
+                           for record in records]
+            for record, future in zip(records, futures):
+                if future.exception() is None:
+                    for k, v in vars(future.result()).items():
+                        if k not in ('_api', '_loader'):
+                            setattr(record, k, v)
+            for future in futures:
+                if future.exception() is not None:
+                    raise future.exception()
+
+        def _execute(self, full_url, hooks, call):
+            self.api.cached_result = False
+            metrics = self.api.metrics
+            timed = metrics is not None or hooks is not None
 
             # Query the cache if on is available
             # and this request uses a GET method.
             if self.use_cache and self.api.cache and self.method == 'GET':
-                cache_result = self.api.cache.get(url)
+                cache_key = self.cache_key()
+                cache_result = self.api.cache.get(cache_key)
                 # if cache result found and not expired, return it
                 if cache_result:
                     # must restore api reference
@@ -167,8 +258,16 @@ def bind_api(**config):
                     else:
                         if isinstance(cache_result, Model):
                             cache_result._api = self.api
+                    self.cached_result = True
                     self.api.cached_result = True
+                    if metrics is not None:
+                        metrics.record_cache(self.endpoint, 'hit')
+                    if hooks is not None:
+                        hooks.emit('on_cache_hit', call, time.time(),
+                                   result=cache_result)
                     return cache_result
+                if metrics is not None:
+                    metrics.record_cache(self.endpoint, 'miss')
 
             # Continue attempting request until successful
             # or maximum number of retries is reached.
@@ -176,67 +275,127 @@ def bind_api(**config):
             while retries_performed < self.retry_count + 1:
                 # handle running out of api calls
                 if self.wait_on_rate_limit:
-                    if self._reset_time is not None:
-                        if self._remaining_calls is not None:
-                            if self._remaining_calls < 1:
-                                sleeptime = self._reset_time - int(time.time())
-                                if sleeptime > 0:
-                                    if self.wait_on_rate_limit_notify:
-                                        print("Rate limit reached."
-                                              "Sleeping for:", sleeptime)
-                                    time.sleep(sleeptime + 5)
+                    sleeptime = self.rate_limit.wait_time()
+                    if sleeptime > 0:
+                        if self.wait_on_rate_limit_notify:
+                            print("Rate limit reached."
+                                  "Sleeping for:", sleeptime)
+                        if timed:
+                            started = time.time()
+                        time.sleep(sleeptime + 5)
+                        if metrics is not None:
+                            metrics.record_sleep(self.endpoint, 'rate_limit',
+                                                 sleeptime + 5)
+                        if hooks is not None:
+                            hooks.emit('on_rate_limit_wait', call, started,
+                                       time.time(), reason='rate_limit')
+
+                # Stay within the client side request budget
+                if self.api.rate_budget is not None:
+                    if timed:
+                        started = time.time()
+                    waited = self.api.rate_budget.acquire()
+                    if metrics is not None and waited:
+                        metrics.record_sleep(self.endpoint, 'budget', waited)
+                    if hooks is not None and waited:
+                        hooks.emit('on_rate_limit_wait', call, started,
+                                   time.time(), reason='budget')
 
                 # Apply authentication
-                if self.api.auth:
+                if timed:
+                    started = time.time()
+                auth = None
+                if self.identity is not None:
+                    auth = self.api.auth.apply_auth(self.identity)
+                elif self.api.auth:
                     auth = self.api.auth.apply_auth()
+                if hooks is not None:
+                    call.attempt += 1
+                    hooks.emit('after_auth', call, started, time.time())
+                    hooks.emit('before_request', call, time.time())
 
                 # # Request compression if configured
                 # if self.api.compression:
                 #     self.session.headers['Accept-encoding'] = 'gzip'
 
                 # Execute request
+                if timed:
+                    started = time.time()
                 try:
                     resp = self.session.request(self.method,
                                                 full_url,
+                                                params=self.params,
+                                                headers=self.headers,
                                                 data=self.post_data,
                                                 timeout=self.api.timeout,
                                                 auth=auth,
                                                 proxies=self.api.proxy)
                 except Exception as e:
+                    if hooks is not None:
+                        hooks.emit('after_response', call, started,
+                                   time.time(), response=None, error=e)
                     raise RingPlusError('Failed to send request: %s' % e)
 
-                rem_calls = resp.headers.get('x-rate-limit-remaining')
-                if rem_calls is not None:
-                        self._remaining_calls = int(rem_calls)
-                elif isinstance(self._remaining_calls, int):
-                    self._remaining_calls -= 1
-                reset_time = resp.headers.get('x-rate-limit-reset')
-                if reset_time is not None:
-                    self._reset_time = int(reset_time)
-                if self.wait_on_rate_limit and self._remaining_calls == 0 and (
+                if timed:
+                    finished = time.time()
+                    if metrics is not None:
+                        self.record_response(metrics, resp,
+                                             finished - started)
+                    if hooks is not None:
+                        hooks.emit('after_response', call, started,
+                                   finished, response=resp)
+
+                self.rate_limit.update(resp.headers)
+                if self.wait_on_rate_limit and \
+                        self.rate_limit.remaining == 0 and (
                         # if ran out of calls before waiting switching,
                         # retry last call
                         resp.status_code == 429 or resp.status_code == 420):
+                    if metrics is not None:
+                        metrics.record_retry(self.endpoint, 'rate_limited')
                     continue
                 retry_delay = self.retry_delay
+                sleep_reason = 'retry'
                 # Exit request loop if non-retry error code
-                if resp.status_code == 200:
+                # 304 answers a conditional request (If-None-Match)
+                if 200 <= resp.status_code < 300 or resp.status_code == 304:
                     break
                 elif (resp.status_code == 429 or resp.status_code == 420) and \
                       self.wait_on_rate_limit:
                     if 'retry-after' in resp.headers:
                         retry_delay = float(resp.headers['retry-after'])
+                        sleep_reason = 'retry_after'
                 elif self.retry_errors and \
                         resp.status_code not in self.retry_errors:
                     break
 
                 # Sleep before retrying request again
+                if timed:
+                    started = time.time()
                 time.sleep(retry_delay)
                 retries_performed += 1
+                if hooks is not None:
+                    hooks.emit('on_retry', call, started, time.time(),
+                               response=resp, reason=sleep_reason,
+                               delay=retry_delay)
+                if metrics is not None:
+                    metrics.record_sleep(self.endpoint, sleep_reason,
+                                         retry_delay)
+                    if retries_performed < self.retry_count + 1:
+                        metrics.record_retry(self.endpoint,
+                                             'status_%d' % resp.status_code)
 
             # If an error was returned, throw an exception
             self.api.last_response = resp
+            self.response = resp
+            if resp.status_code == 304:
+                # Not modified since the version the caller already has.
+                if metrics is not None:
+                    metrics.record_cache(self.endpoint, 'not_modified')
+                return None
             if resp.status_code and not 200 <= resp.status_code < 300:
+                if timed:
+                    started = time.time()
                 try:
                     error_msg, api_error_code = \
                         self.parser.parse_error(resp.text)
@@ -244,6 +403,9 @@ def bind_api(**config):
                     error_msg = "Error response: status code = %s" \
                         % resp.status_code
                     api_error_code = None
+                if hooks is not None:
+                    hooks.emit('after_parse_error', call, started,
+                               time.time(), response=resp)
 
                 if is_rate_limit_error_message(error_msg):
                     raise RateLimitError(error_msg, resp)
@@ -252,18 +414,56 @@ def bind_api(**config):
                                         api_code=api_error_code)
 
             # Parse the response payload
-            result = self.parser.parse(self, resp.text)
+            if not timed:
+                result = self.parser.parse(self, resp.text)
+            else:
+                started = time.time()
+                result = self.parser.parse(self, resp.text)
+                finished = time.time()
+                if metrics is not None:
+                    metrics.record_parse(self.endpoint, finished - started)
+                if hooks is not None:
+                    hooks.emit('after_parse', call, started, finished,
+                               result=result)
 
             # Store result into cache if one is available.
             if self.use_cache and self.api.cache and \
                     self.method == 'GET' and result:
-                self.api.cache.store(url, result)
+                if timed:
+                    started = time.time()
+                self.api.cache.store(cache_key, result)
+                if hooks is not None:
+                    hooks.emit('after_cache_store', call, started,
+                               time.time())
 
             return result
 
+        def record_response(self, metrics, resp, total):
+            """Record a response, total is the seconds request() took."""
+            elapsed = getattr(resp, 'elapsed', None)
+            # requests sets elapsed once the headers are read, the rest of
+            # the call is spent reading the body.
+            response_time = elapsed.total_seconds() \
+                if elapsed is not None else total
+            content = getattr(resp, 'content', None) or b''
+            metrics.record_response(self.endpoint, resp.status_code,
+                                    response_time,
+                                    max(0.0, total - response_time),
+                                    len(content))
+
+        def cache_key(self):
+            """Key of the cached result, partitioned by identity."""
+            key = self.path
+            if self.params:
+                key += '?' + urlencode(sorted(self.params.items()))
+            if self.identity is not None:
+                key = '%s:%s' % (self.identity, key)
+            return key
+
     def _call(*args, **kwargs):
+        create = kwargs.pop('create', False)
         method = APIMethod(args, kwargs)
-        if kwargs.get('create'):
+        if create:
             return method
         else:
             return method.execute()
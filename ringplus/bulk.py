@@ -0,0 +1,163 @@
+"""Bulk operations running many API calls concurrently."""
+
+from __future__ import print_function
+
+import collections
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ringplus.cursor import Cursor
+from ringplus.error import is_transient
+
+log = logging.getLogger('ringplus.bulk')
+
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+
+class Outcome(object):
+    """Result of the operation on a single ID."""
+
+    def __init__(self, id):
+        self.id = id
+        self.status = None
+        self.attempts = 0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.status == DELETED
+
+    def __repr__(self):
+        return 'Outcome(id=%r, status=%r, attempts=%d, error=%r)' % (
+            self.id, self.status, self.attempts, self.error)
+
+
+class BulkReport(object):
+    """Per-ID outcomes of a bulk operation, in the order IDs were given."""
+
+    def __init__(self):
+        self.outcomes = collections.OrderedDict()
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    def __iter__(self):
+        return iter(self.outcomes.values())
+
+    def __getitem__(self, id):
+        return self.outcomes[id]
+
+    def with_status(self, status):
+        return [outcome for outcome in self if outcome.status == status]
+
+    @property
+    def succeeded(self):
+        return self.with_status(DELETED)
+
+    @property
+    def failed(self):
+        return self.with_status(FAILED)
+
+    def summary(self):
+        """Return the number of outcomes per status."""
+        return dict(collections.Counter(outcome.status for outcome in self))
+
+    def __repr__(self):
+        return 'BulkReport(%r, elapsed=%.2f)' % (self.summary(),
+                                                 self.elapsed)
+
+
+def older_than(days):
+    """Predicate matching voicemail received more than days ago."""
+    def predicate(message):
+        received_on = getattr(message, 'received_on', None)
+        if received_on is None:
+            return False
+        now = datetime.datetime.now(received_on.tzinfo)
+        return now - received_on > datetime.timedelta(days=days)
+    return predicate
+
+
+def delete_voicemail(api, ids=None, voicemail_box_id=None, predicate=None,
+                     max_workers=4, retries=3, retry_delay=1.0):
+    """Delete many voicemail messages concurrently.
+
+    The messages are either given by ID or selected from a voicemail box
+    with a predicate. Matching messages are collected before anything is
+    deleted, so the deletions cannot shift the pages being read. Calls go
+    through the API, so an API RateBudget also limits this job. Transient
+    failures (connection errors, 429 and 5xx responses) are retried with
+    exponential backoff, honouring retry-after. One failing message never
+    stops the others.
+
+    Example:
+        report = delete_voicemail(api, voicemail_box_id=box_id,
+                                  predicate=older_than(90))
+        print(report.summary())
+
+    Args:
+        api: API instance.
+        ids: Iterable of voicemail message IDs.
+        voicemail_box_id: Box to select messages from, with predicate.
+        predicate: Callable taking a Voicemail and returning whether to
+            delete it. default: every message of the box
+        max_workers: Deletions running at once. default: 4
+        retries: Extra attempts after a transient failure. default: 3
+        retry_delay: Delay before the first retry in seconds, doubled on
+            every further one. default: 1
+
+    Returns:
+        BulkReport
+    """
+    started = time.time()
+    if ids is None:
+        ids = [message.id for message in
+               Cursor(api.voicemail, voicemail_box_id=voicemail_box_id,
+                      per_page=100).items()
+               if predicate is None or predicate(message)]
+
+    report = BulkReport()
+    for id in ids:
+        report.outcomes[id] = Outcome(id)
+
+    def delete(outcome):
+        delay = retry_delay
+        while True:
+            outcome.attempts += 1
+            try:
+                api.delete_voicemail(voicemail_message_id=outcome.id)
+            except Exception as e:
+                response = getattr(e, 'response', None)
+                if response is not None and response.status_code == 404:
+                    outcome.status = NOT_FOUND
+                    return
+                if is_transient(e) and outcome.attempts <= retries:
+                    wait = delay
+                    if response is not None and \
+                            'retry-after' in response.headers:
+                        wait = float(response.headers['retry-after'])
+                    log.info('Deleting voicemail %s failed, retrying in '
+                             '%ss: %s', outcome.id, wait, e)
+                    time.sleep(wait)
+                    delay *= 2
+                    continue
+                outcome.status = FAILED
+                outcome.error = e
+                return
+            outcome.status = DELETED
+            return
+
+    executor = ThreadPoolExecutor(max_workers)
+    try:
+        for future in [executor.submit(delete, outcome)
+                       for outcome in report]:
+            future.result()
+    finally:
+        executor.shutdown()
+    report.elapsed = time.time() - started
+    return report
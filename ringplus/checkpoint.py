@@ -0,0 +1,64 @@
+"""Durable progress checkpoints for long running jobs."""
+
+from __future__ import print_function
+
+import os
+import threading
+
+from ringplus.utils import atomic_write, import_simplejson
+
+json = import_simplejson()
+
+
+class JSONCheckpoint(object):
+    """A small key/value store persisted atomically to a JSON file.
+
+    Every save rewrites the whole file through a temporary file and a
+    rename, so an interrupted process leaves either the previous or the new
+    state on disk, never a truncated one. Values must be JSON serializable.
+
+    Args:
+        path: Location of the checkpoint file. It is created on first save.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        if not content:
+            return {}
+        return json.loads(content.decode('utf-8'))
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._state.get(key, default)
+
+    def set(self, key, value, save=True):
+        with self._lock:
+            self._state[key] = value
+            if save:
+                self._save()
+
+    def delete(self, key, save=True):
+        with self._lock:
+            self._state.pop(key, None)
+            if save:
+                self._save()
+
+    def keys(self):
+        with self._lock:
+            return list(self._state.keys())
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        data = json.dumps(self._state, sort_keys=True)
+        atomic_write(self.path, data.encode('utf-8'))
@@ -0,0 +1,306 @@
+"""Parsing of raw response bodies into columnar batches in worker processes.
+
+Parsing JSON and ISO 8601 dates is CPU bound, so with many concurrent
+fetches one core ends up parsing for all of them. ParallelParser moves
+that work to a process pool. Workers send back ColumnBatch objects made
+of array.array and bytes buffers, which pickle as flat copies of their
+memory instead of graphs of Python objects.
+"""
+
+from __future__ import print_function
+
+import array
+import datetime
+
+import iso8601
+
+from ringplus.error import RingPlusError
+from ringplus.utils import import_simplejson
+
+json = import_simplejson()
+
+# Column kinds, with the array typecode of their values
+KINDS = {
+    'int': 'q',
+    'float': 'd',
+    'bool': 'b',
+    'time': 'd',  # UTC unix timestamps, NaN when missing
+    'str': None,  # utf-8 bytes and offsets
+    'json': None,  # JSON encoded values, for nested objects
+}
+
+_NULL_INT = -2 ** 63
+
+# Container key of the list responses, as in the models' parse_list
+CONTAINERS = {
+    'user': 'users',
+    'account': 'accounts',
+    'call': 'phone_calls',
+    'text': 'phone_texts',
+    'data': 'phone_data',
+    'voicemail': 'voicemail_messages',
+    'fluidcall': 'fluidcall_credentials',
+    'carrier_service': 'enforced_carrier_services',
+}
+
+
+def is_date_field(name):
+    """Whether the models parse a field as a date."""
+    return name.endswith(('_on', '_at')) or name == 'start_time' or \
+        'date' in name
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=iso8601.UTC)
+# Much faster than iso8601, but stricter before Python 3.11
+_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+
+
+def _epoch(value):
+    """Convert an iso 8601 string into a UTC unix timestamp."""
+    date = None
+    if _fromisoformat is not None:
+        try:
+            date = _fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    if date is None:
+        date = iso8601.parse_date(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=iso8601.UTC)
+    return (date - _EPOCH).total_seconds()
+
+
+class Column(object):
+    """Values of one field across the records of a batch.
+
+    Attributes:
+        kind: One of KINDS.
+        values: array.array of the values, or bytes of the concatenated
+            utf-8 values of str and json columns.
+        offsets: For str and json columns, array.array('q') where value i
+            is values[offsets[i]:offsets[i + 1]].
+        nulls: bytearray with 1 for missing values, None if none is.
+    """
+
+    __slots__ = ('kind', 'values', 'offsets', 'nulls')
+
+    def __init__(self, kind, values, offsets=None, nulls=None):
+        self.kind = kind
+        self.values = values
+        self.offsets = offsets
+        self.nulls = nulls
+
+    @classmethod
+    def build(cls, name, items):
+        """Build the column of field name from a list of values."""
+        present = [value for value in items if value is not None]
+        nulls = bytearray(1 if value is None else 0 for value in items) \
+            if len(present) < len(items) else None
+        kind = _kind(name, present)
+        if kind == 'time':
+            try:
+                values = array.array('d', (
+                    float('nan') if value is None else _epoch(value)
+                    for value in items))
+            except iso8601.ParseError:
+                kind = 'str'
+        if kind == 'float':
+            values = array.array('d', (float('nan') if value is None
+                                       else value for value in items))
+        elif kind in ('int', 'bool'):
+            values = array.array(KINDS[kind], (
+                (_NULL_INT if kind == 'int' else 0) if value is None
+                else value for value in items))
+        elif kind in ('str', 'json'):
+            if kind == 'json':
+                encoded = [b'' if value is None else
+                           json.dumps(value).encode('utf-8')
+                           for value in items]
+            else:
+                encoded = [b'' if value is None else value.encode('utf-8')
+                           for value in items]
+            offsets = array.array('q', [0])
+            for value in encoded:
+                offsets.append(offsets[-1] + len(value))
+            return cls(kind, b''.join(encoded), offsets, nulls)
+        return cls(kind, values, None, nulls)
+
+    def __len__(self):
+        if self.offsets is not None:
+            return len(self.offsets) - 1
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        if self.offsets is None:
+            value = self.values[i]
+            return bool(value) if self.kind == 'bool' else value
+        value = self.values[self.offsets[i]:self.offsets[i + 1]]
+        value = value.decode('utf-8')
+        return json.loads(value) if self.kind == 'json' else value
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+    def nbytes(self):
+        """Size of the buffers of the column."""
+        size = len(self.values) if self.offsets is not None else \
+            self.values.itemsize * len(self.values)
+        if self.offsets is not None:
+            size += self.offsets.itemsize * len(self.offsets)
+        if self.nulls is not None:
+            size += len(self.nulls)
+        return size
+
+
+def _kind(name, values):
+    if not values:
+        return 'json'
+    types = set(type(value) for value in values)
+    if types == set([bool]):
+        return 'bool'
+    if types <= set([int]) and bool not in types:
+        return 'int'
+    if types <= set([int, float]) and bool not in types:
+        return 'float'
+    if types <= set([str, type(u'')]):
+        # Column.build falls back to str if the values are not dates
+        return 'time' if is_date_field(name) else 'str'
+    return 'json'
+
+
+class ColumnBatch(object):
+    """The records of a response, stored column by column.
+
+    Example:
+        batch.column('duration')       # list of durations
+        batch.columns['start_time'].values  # array('d') of timestamps
+        for row in batch.rows():       # dicts, dates as timestamps
+            ...
+
+    Attributes:
+        payload_type: payload_type of the endpoint the records came from.
+        columns: Dict of field name -> Column.
+    """
+
+    def __init__(self, payload_type, columns, length):
+        self.payload_type = payload_type
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_records(cls, payload_type, records):
+        fields = []
+        seen = set()
+        for record in records:
+            for field in record:
+                if field not in seen:
+                    seen.add(field)
+                    fields.append(field)
+        columns = dict((field, Column.build(
+            field, [record.get(field) for record in records]))
+            for field in fields)
+        return cls(payload_type, columns, len(records))
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def column(self, name):
+        """Return the values of a field as a list."""
+        return self.columns[name].tolist()
+
+    def rows(self):
+        """Yield every record as a dict, with dates as timestamps."""
+        for i in range(self.length):
+            yield dict((name, column[i])
+                       for name, column in self.columns.items())
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def __repr__(self):
+        return 'ColumnBatch(%r, %d records, %d fields)' % (
+            self.payload_type, self.length, len(self.columns))
+
+
+def _records(payload_type, body):
+    """Return the list of records of a JSON response body."""
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        container = CONTAINERS.get(payload_type)
+        if container in payload:
+            return payload[container]
+        # A single object, e.g. get_account
+        return [payload]
+    return payload
+
+
+def parse_columns(payload_type, body):
+    """Parse a raw response body into a ColumnBatch.
+
+    Runs in the worker processes of ParallelParser, and can be called
+    directly too.
+    """
+    return ColumnBatch.from_records(payload_type,
+                                    _records(payload_type, body))
+
+
+class ParallelParser(object):
+    """Parse raw response bodies in a pool of processes.
+
+    Fetch the bodies with parser=RawParser() and hand them over; the
+    fetching threads stay free for the network while the workers parse.
+
+    Example:
+        raw = RawParser()
+        with ParallelParser() as parser:
+            futures = [parser.submit('call', api.calls(
+                account_id=account_id, per_page=100, parser=raw))
+                for account_id in account_ids]
+            for future in futures:
+                batch = future.result()
+                store(batch.column('id'), batch.columns['start_time'].values)
+
+    Args:
+        max_workers: Processes. default: the number of CPUs
+        executor: An existing concurrent.futures executor to use instead.
+    """
+
+    def __init__(self, max_workers=None, executor=None):
+        self._own_executor = executor is None
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers)
+        self.executor = executor
+
+    def submit(self, payload_type, body):
+        """Parse a body in a worker. Returns a Future of a ColumnBatch."""
+        if body is None:
+            raise RingPlusError('No body to parse')
+        return self.executor.submit(parse_columns, payload_type, body)
+
+    def parse(self, payload_type, body):
+        """Parse a body in a worker and wait for the ColumnBatch."""
+        return self.submit(payload_type, body).result()
+
+    def map(self, payload_type, bodies, chunksize=1):
+        """Parse many bodies, yielding their ColumnBatch in order."""
+        bodies = list(bodies)
+        return self.executor.map(parse_columns,
+                                 [payload_type] * len(bodies), bodies,
+                                 chunksize=chunksize)
+
+    def close(self, wait=True):
+        if self._own_executor:
+            self.executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,105 @@
+"""Pagination helpers for paged API calls."""
+
+from __future__ import print_function
+
+from ringplus.error import RingPlusError
+
+
+class Cursor(object):
+    """Iterate over the pages or items of a paged API method.
+
+    Example:
+        for call in Cursor(api.calls, account_id=1234).items():
+            print(call.start_time)
+    """
+
+    def __init__(self, method, *args, **kwargs):
+        if hasattr(method, 'pagination_mode'):
+            if method.pagination_mode == 'page':
+                self.iterator = PageIterator(method, args, kwargs)
+            else:
+                raise RingPlusError('Invalid pagination mode.')
+        else:
+            raise RingPlusError('This method does not perform pagination')
+
+    def pages(self, limit=0):
+        """Return iterator for pages."""
+        if limit > 0:
+            self.iterator.limit = limit
+        return self.iterator
+
+    def items(self, limit=0):
+        """Return iterator for items in each page."""
+        i = ItemIterator(self.iterator)
+        i.limit = limit
+        return i
+
+
+class BaseIterator(object):
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.limit = 0
+
+    def __next__(self):
+        return self.next()
+
+    def next(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        return self
+
+
+class PageIterator(BaseIterator):
+    """Iterate over pages until an empty or partial page is returned.
+
+    Args:
+        page (optional): The first page to fetch. Defaults to 1.
+        per_page (optional): Page size; a page shorter than this is treated
+            as the last one. Defaults to 25, as on the API.
+    """
+
+    def __init__(self, method, args, kwargs):
+        BaseIterator.__init__(self, method, args, kwargs)
+        self.current_page = self.kwargs.pop('page', 1)
+        self.per_page = self.kwargs.setdefault('per_page', 25)
+        self.page_count = 0
+        self._exhausted = False
+
+    def next(self):
+        if self._exhausted or \
+                (self.limit > 0 and self.page_count == self.limit):
+            raise StopIteration
+        items = self.method(page=self.current_page, *self.args, **self.kwargs)
+        if len(items) == 0:
+            raise StopIteration
+        if len(items) < self.per_page:
+            self._exhausted = True
+        self.current_page += 1
+        self.page_count += 1
+        return items
+
+
+class ItemIterator(BaseIterator):
+
+    def __init__(self, page_iterator):
+        self.page_iterator = page_iterator
+        self.limit = 0
+        self.current_page = None
+        self.page_index = -1
+        self.num_items = 0
+
+    def next(self):
+        if self.limit > 0 and self.num_items == self.limit:
+            raise StopIteration
+        if self.current_page is None or \
+                self.page_index == len(self.current_page) - 1:
+            # Reached end of current page, get the next page...
+            self.current_page = next(self.page_iterator)
+            self.page_index = -1
+        self.page_index += 1
+        self.num_items += 1
+        return self.current_page[self.page_index]
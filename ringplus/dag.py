@@ -0,0 +1,315 @@
+"""Concurrent execution of dependent API calls."""
+
+from __future__ import print_function
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from six.moves import queue
+
+from ringplus.error import RingPlusError
+
+log = logging.getLogger('ringplus.dag')
+
+
+class Node(object):
+    """A step of a DAG, see DAG.task and DAG.map."""
+
+    __slots__ = ('name', 'function', 'inputs', 'over', 'flatten',
+                 'dependants')
+
+    def __init__(self, name, function, inputs, over=None, flatten=False):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        # The node whose outputs this map node runs on, None for a task
+        self.over = over
+        self.flatten = flatten
+        self.dependants = []
+
+    @property
+    def is_map(self):
+        return self.over is not None
+
+    def __repr__(self):
+        return 'Node(%r)' % self.name
+
+
+class UpstreamError(RingPlusError):
+    """A step did not run because a step it depends on failed."""
+    pass
+
+
+class DAGResult(object):
+    """Results of a DAG run.
+
+    result['name'] is the value of a task, or the list of values of a map
+    in the order of its items. Failed steps and items are left out of the
+    values and listed in errors instead.
+
+    Attributes:
+        errors: Dict of step name -> list of (item, exception); item is
+            None for tasks.
+        elapsed: Seconds the run took.
+    """
+
+    def __init__(self, nodes):
+        self._nodes = dict((node.name, node) for node in nodes)
+        # name -> {key: (item, value)}
+        self._values = dict((node.name, {}) for node in nodes)
+        self.errors = {}
+        self.elapsed = 0.0
+
+    def _set(self, node, key, item, value):
+        self._values[node.name][key] = (item, value)
+
+    def _fail(self, node, item, error):
+        self.errors.setdefault(node.name, []).append((item, error))
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __getitem__(self, name):
+        node = self._nodes[name]
+        if not node.is_map:
+            try:
+                return self._values[name][()][1]
+            except KeyError:
+                raise RingPlusError('Step %s failed: %r' % (
+                    name, self.errors[name][0][1]))
+        return [value for item, value in self.items(name)]
+
+    def items(self, name):
+        """Return the (item, value) pairs of a map, in item order."""
+        values = self._values[name]
+        return [values[key] for key in sorted(values)]
+
+    def outputs(self, name):
+        """Return what maps over the step run on, in order."""
+        node = self._nodes[name]
+        outputs = []
+        for key in sorted(self._values[name]):
+            for output_key, output in _outputs(node, key,
+                                               self._values[name][key][1]):
+                outputs.append(output)
+        return outputs
+
+    def rows(self, over, *names):
+        """Join the outputs of a step with the maps running over it.
+
+        Returns:
+            list: A dict per output of over, holding the output under the
+            name over and the value of each of names for that output
+            (None if it failed).
+        """
+        by_item = {}
+        for name in names:
+            if self._nodes[name].over is not self._nodes[over]:
+                raise RingPlusError('%s does not map over %s' % (name,
+                                                                 over))
+            by_item[name] = dict((id(item), value) for item, value in
+                                 self._values[name].values())
+        rows = []
+        for output in self.outputs(over):
+            row = {over: output}
+            for name in names:
+                row[name] = by_item[name].get(id(output))
+            rows.append(row)
+        return rows
+
+    def __repr__(self):
+        return 'DAGResult(%s, errors=%d, elapsed=%.2f)' % (
+            ', '.join(sorted(self._nodes)),
+            sum(len(errors) for errors in self.errors.values()),
+            self.elapsed)
+
+
+def _outputs(node, key, value):
+    """Yield the (key, output) pairs maps over node run on."""
+    if node.is_map and not node.flatten:
+        yield key, value
+    elif isinstance(value, (list, tuple)):
+        for i, output in enumerate(value):
+            yield key + (i,), output
+    elif value is not None:
+        yield key + (0,), value
+
+
+class DAG(object):
+    """Run API calls that depend on each other with bounded concurrency.
+
+    Steps declare the steps whose results they need. A task runs once
+    with the values of its inputs; a map runs once per output of the step
+    it maps over, as soon as that output exists, so the branches of a
+    fan out proceed independently and the run takes about as long as its
+    longest chain of calls rather than the sum of all of them.
+
+    A task or an unflattened map outputs its values; a task returning a
+    list, or a map with flatten=True returning lists, outputs their
+    elements.
+
+    Example:
+        dag = DAG(max_workers=16)
+        users = dag.task('users', lambda: api.users(per_page=100))
+        accounts = dag.map('accounts',
+                           lambda user: api.user_accounts(user_id=user.id),
+                           over=users, flatten=True)
+        dag.map('details', lambda a: api.get_account(account_id=a.id),
+                over=accounts)
+        dag.map('carriers',
+                lambda a: api.enforced_carrier_services(account_id=a.id),
+                over=accounts)
+        dag.map('calls', lambda a: api.calls(account_id=a.id, per_page=10),
+                over=accounts)
+        result = dag.run()
+        for row in result.rows('accounts', 'details', 'carriers', 'calls'):
+            print(row['accounts'].id, row['details'].balance)
+
+    Args:
+        max_workers: Calls running at once. default: 8
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.nodes = []
+
+    def _add(self, node):
+        if any(existing.name == node.name for existing in self.nodes):
+            raise RingPlusError('Duplicate step name: %s' % node.name)
+        for upstream in node.inputs + ([node.over] if node.over else []):
+            if upstream not in self.nodes:
+                raise RingPlusError('Step %s depends on a step of another '
+                                    'DAG: %s' % (node.name, upstream.name))
+            upstream.dependants.append(node)
+        self.nodes.append(node)
+        return node
+
+    def task(self, name, function, inputs=()):
+        """Add a step calling function(*values of inputs) once."""
+        return self._add(Node(name, function, list(inputs)))
+
+    def map(self, name, function, over, inputs=(), flatten=False):
+        """Add a step calling function(output, *values of inputs) for
+        every output of the step over."""
+        return self._add(Node(name, function, list(inputs), over, flatten))
+
+    def run(self, raise_errors=False):
+        """Run every step and return a DAGResult.
+
+        Args:
+            raise_errors: Raise the first error instead of recording it
+                in DAGResult.errors. default: False
+        """
+        return _Run(self, raise_errors).run()
+
+
+class _Run(object):
+    """State of one DAG.run, only touched by the thread calling run."""
+
+    def __init__(self, dag, raise_errors):
+        self.dag = dag
+        self.raise_errors = raise_errors
+        self.result = DAGResult(dag.nodes)
+        self.done = set()
+        self.failed = set()
+        # Calls submitted and not finished, per node
+        self.running = dict((node, 0) for node in dag.nodes)
+        # Outputs of the node over, waiting for a map's inputs
+        self.waiting = dict((node, []) for node in dag.nodes)
+        self.completed = queue.Queue()
+
+    def run(self):
+        started = time.time()
+        self.executor = ThreadPoolExecutor(self.dag.max_workers)
+        try:
+            for node in self.dag.nodes:
+                if not node.is_map and not node.inputs:
+                    self.submit(node, (), None, ())
+            while any(self.running.values()):
+                node, key, item, value, error = self.completed.get()
+                self.running[node] -= 1
+                if error is not None:
+                    if self.raise_errors:
+                        raise error
+                    log.warning('Step %s failed for %r: %s', node.name,
+                                item, error)
+                    self.result._fail(node, item, error)
+                    if not node.is_map:
+                        self.failed.add(node)
+                else:
+                    self.result._set(node, key, item, value)
+                    self.emit(node, key, value)
+                self.check_done(node)
+        finally:
+            self.executor.shutdown(wait=not self.raise_errors)
+        self.result.elapsed = time.time() - started
+        return self.result
+
+    def submit(self, node, key, item, args):
+        self.running[node] += 1
+
+        def call():
+            try:
+                value = node.function(*args)
+            except Exception as e:
+                self.completed.put((node, key, item, None, e))
+            else:
+                self.completed.put((node, key, item, value, None))
+
+        self.executor.submit(call)
+
+    def inputs_ready(self, node):
+        return all(upstream in self.done for upstream in node.inputs)
+
+    def input_values(self, node):
+        return tuple(self.result[upstream.name] for upstream in node.inputs)
+
+    def emit(self, node, key, value):
+        """Start the maps over node on the outputs of one of its values."""
+        maps = [dependant for dependant in node.dependants
+                if dependant.over is node]
+        if not maps:
+            return
+        for output_key, output in _outputs(node, key, value):
+            for dependant in maps:
+                if dependant in self.failed:
+                    continue
+                if self.inputs_ready(dependant):
+                    self.submit(dependant, output_key, output,
+                                (output,) + self.input_values(dependant))
+                else:
+                    self.waiting[dependant].append((output_key, output))
+
+    def check_done(self, node):
+        if node in self.done or self.running[node]:
+            return
+        if node.is_map and node.over not in self.done | self.failed:
+            return
+        if node in self.failed or (node.is_map and node.over in self.failed):
+            self.fail_dependants(node)
+            return
+        self.done.add(node)
+        for dependant in node.dependants:
+            if dependant in self.done | self.failed:
+                continue
+            if not self.inputs_ready(dependant):
+                continue
+            if dependant.is_map:
+                for output_key, output in self.waiting[dependant]:
+                    self.submit(dependant, output_key, output,
+                                (output,) + self.input_values(dependant))
+                self.waiting[dependant] = []
+            else:
+                self.submit(dependant, (), None,
+                            self.input_values(dependant))
+            self.check_done(dependant)
+
+    def fail_dependants(self, node):
+        self.failed.add(node)
+        for dependant in node.dependants:
+            if dependant in self.failed or dependant in self.done:
+                continue
+            self.result._fail(dependant, None, UpstreamError(
+                'Step %s failed' % node.name))
+            self.fail_dependants(dependant)
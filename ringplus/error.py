@@ -47,5 +47,20 @@ def is_rate_limit_error_message(message):
         and message[0]['code'] == 88
 
 
+# Status codes worth retrying a request after, instead of giving up.
+TRANSIENT_STATUS_CODES = (420, 429, 500, 502, 503, 504)
+
+
+def is_transient(error):
+    """Check if a failed request is worth trying again."""
+    if not isinstance(error, RingPlusError):
+        return False
+    response = error.response
+    if response is None:
+        # The request could not be sent at all.
+        return True
+    return response.status_code in TRANSIENT_STATUS_CODES
+
+
 class RateLimitError(RingPlusError):
     pass
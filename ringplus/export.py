@@ -0,0 +1,252 @@
+"""Streaming export of paged usage history to files."""
+
+from __future__ import print_function
+
+import csv
+import logging
+import os
+import time
+
+import six
+
+from ringplus.cursor import Cursor
+from ringplus.error import RingPlusError
+from ringplus.models import Model
+from ringplus.utils import import_simplejson
+
+json = import_simplejson()
+
+log = logging.getLogger('ringplus.export')
+
+
+def model_to_dict(model):
+    """Default converter: the JSON the model was parsed from."""
+    if isinstance(model, Model):
+        return model._json
+    return model
+
+
+class ExportStats(object):
+    """Progress of an export."""
+
+    def __init__(self, rows=0, pages=0):
+        self.rows = rows
+        self.pages = pages
+        self.started = time.time()
+        self.elapsed = 0.0
+        # Rows already present in the file when a resumed export started.
+        self.resumed_rows = rows
+
+    @property
+    def rows_per_sec(self):
+        exported = self.rows - self.resumed_rows
+        return exported / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return 'ExportStats(rows=%d, pages=%d, elapsed=%.2f, ' \
+               'rows_per_sec=%.1f)' % (self.rows, self.pages, self.elapsed,
+                                       self.rows_per_sec)
+
+
+class _FileWriter(object):
+    """Base class for writers appending chunks to a single file."""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self.file = None
+
+    def open(self, position):
+        """Open the file, discarding anything after position if resuming."""
+        if position:
+            self.file = open(self.path, 'r+b')
+            self.file.seek(position)
+            self.file.truncate()
+        else:
+            self.file = open(self.path, 'wb')
+
+    def write(self, rows):
+        self.file.write(self.encode(rows))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def encode(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class CSVWriter(_FileWriter):
+
+    def open(self, position):
+        _FileWriter.open(self, position)
+        self._header = not position
+
+    def encode(self, rows):
+        if self.fields is None:
+            self.fields = sorted(rows[0].keys())
+        buf = six.StringIO()
+        writer = csv.DictWriter(buf, self.fields, extrasaction='ignore')
+        if self._header:
+            writer.writeheader()
+            self._header = False
+        for row in rows:
+            writer.writerow(dict((k, _flatten(v)) for k, v in row.items()))
+        data = buf.getvalue()
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        return data
+
+
+class JSONLinesWriter(_FileWriter):
+
+    def encode(self, rows):
+        if self.fields is not None:
+            rows = [dict((k, row.get(k)) for k in self.fields)
+                    for row in rows]
+        lines = ''.join(json.dumps(row, default=str) + '\n' for row in rows)
+        return lines.encode('utf-8')
+
+
+class ParquetWriter(object):
+    """Writes each chunk as a compressed Parquet part inside a directory.
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, path, fields, compression='zstd'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RingPlusError('pyarrow is required for parquet exports')
+        self.pyarrow = pyarrow
+        self.path = path
+        self.fields = fields
+        self.compression = compression
+        self.part = 0
+
+    def open(self, position):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.part = position or 0
+
+    def write(self, rows):
+        if self.fields is None:
+            self.fields = sorted(rows[0].keys())
+        columns = dict((field, [_flatten(row.get(field)) for row in rows])
+                       for field in self.fields)
+        table = self.pyarrow.table(columns)
+        part_path = os.path.join(self.path, 'part-%05d.parquet' % self.part)
+        self.pyarrow.parquet.write_table(table, part_path,
+                                         compression=self.compression)
+        self.part += 1
+        return self.part
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def _flatten(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+class Exporter(object):
+    """Stream every page of a paged API method into a file.
+
+    Pages are fetched one at a time and converted rows are written every
+    chunk_size rows, so memory use does not depend on the length of the
+    history. When a checkpoint is given, the next page to fetch and the
+    position in the output are saved after each written chunk and a later
+    export to the same path resumes from there.
+
+    Example:
+        exporter = Exporter('calls.csv', checkpoint=JSONCheckpoint('e.json'))
+        stats = exporter.export(api.calls, account_id=1234)
+
+    Args:
+        path: Output file, or output directory for 'parquet'.
+        format: One of 'csv', 'jsonl' or 'parquet'. default: 'csv'
+        fields: Columns to write. default: keys of the first row
+        converter: Callable turning a model into a dictionary.
+            default: model_to_dict
+        chunk_size: Rows buffered before each write. default: 1000
+        checkpoint: Optional checkpoint used to resume exports.
+        progress: Optional callable receiving ExportStats after each chunk.
+    """
+
+    def __init__(self, path, format='csv', fields=None, converter=None,
+                 chunk_size=1000, checkpoint=None, progress=None):
+        if format not in WRITERS:
+            raise RingPlusError('Unknown export format: %s' % format)
+        self.path = path
+        self.format = format
+        self.fields = fields
+        self.converter = converter or model_to_dict
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.progress = progress
+
+    def export(self, method, *args, **kwargs):
+        """Export all pages of method(*args, **kwargs).
+
+        Returns:
+            ExportStats
+        """
+        key = 'export:' + os.path.abspath(self.path)
+        state = (self.checkpoint and self.checkpoint.get(key)) or {}
+        if state:
+            log.info('Resuming export of %s at page %s', self.path,
+                     state['page'])
+            kwargs['page'] = state['page']
+
+        writer = WRITERS[self.format](self.path, state.get('fields',
+                                                           self.fields))
+        writer.open(state.get('position'))
+        stats = ExportStats(rows=state.get('rows', 0),
+                            pages=state.get('page', 1) - 1)
+        cursor = Cursor(method, *args, **kwargs)
+        pages = cursor.pages()
+        buffered = []
+        try:
+            for page in pages:
+                buffered.extend(self.converter(item) for item in page)
+                stats.pages += 1
+                if len(buffered) >= self.chunk_size:
+                    self._flush(writer, buffered, stats, key,
+                                pages.current_page)
+                    buffered = []
+            if buffered:
+                self._flush(writer, buffered, stats, key, pages.current_page)
+        finally:
+            writer.close()
+
+        if self.checkpoint:
+            self.checkpoint.delete(key)
+        stats.elapsed = time.time() - stats.started
+        log.info('Exported %s', stats)
+        return stats
+
+    def _flush(self, writer, rows, stats, key, next_page):
+        position = writer.write(rows)
+        stats.rows += len(rows)
+        stats.elapsed = time.time() - stats.started
+        if self.checkpoint:
+            self.checkpoint.set(key, {'page': next_page,
+                                      'position': position,
+                                      'rows': stats.rows,
+                                      'fields': writer.fields})
+        if self.progress:
+            self.progress(stats)
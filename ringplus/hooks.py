@@ -0,0 +1,143 @@
+"""Events emitted while an API call executes."""
+
+from __future__ import print_function
+
+import binascii
+import logging
+import os
+import threading
+
+from ringplus.error import RingPlusError
+
+log = logging.getLogger('ringplus.hooks')
+
+# Events in the order a call emits them. Events with a duration have
+# start < end, the others happen at an instant (start == end).
+EVENTS = (
+    'before_call',         # the call starts
+    'on_cache_hit',        # the result came from the cache
+    'on_rate_limit_wait',  # slept for the rate limit or the RateBudget
+    'after_auth',          # authentication was applied (duration)
+    'before_request',      # about to send, listeners may edit call.headers
+    'after_response',      # the HTTP request (duration), data: response
+    'on_retry',            # sleeping before a retry (duration)
+    'after_parse_error',   # the error body was parsed (duration)
+    'after_parse',         # the body was parsed (duration), data: result
+    'after_cache_store',   # the result was cached (duration)
+    'after_call',          # the call ends, data: result or error
+)
+
+
+def new_id(size=16):
+    """Return a random hex id of size bytes."""
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class Call(object):
+    """One API call as seen by hook listeners.
+
+    Attributes:
+        id: Correlation id of the call, from the correlation_id keyword
+            argument or random.
+        endpoint: Method and path template, e.g. 'GET /accounts'.
+        url: Full request URL.
+        params: Query or form parameters.
+        headers: Request headers, before_request listeners may add some.
+        identity: TokenRegistry identity of the call, if any.
+        attempt: Number of the current attempt, starting at 1.
+        data: Dict for listeners to keep their own state in.
+    """
+
+    __slots__ = ('id', 'endpoint', 'url', 'params', 'headers', 'identity',
+                 'attempt', 'data')
+
+    def __init__(self, id, endpoint, url, params, headers, identity):
+        self.id = id
+        self.endpoint = endpoint
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.identity = identity
+        self.attempt = 0
+        self.data = {}
+
+    def __repr__(self):
+        return 'Call(id=%r, endpoint=%r)' % (self.id, self.endpoint)
+
+
+class Event(object):
+    """An event of a call, passed to the listeners.
+
+    Attributes:
+        name: One of EVENTS.
+        call: The Call.
+        start, end: Timestamps (time.time()) of the event.
+        data: Event specific values, e.g. response, result, error, delay,
+            reason.
+    """
+
+    __slots__ = ('name', 'call', 'start', 'end', 'data')
+
+    def __init__(self, name, call, start, end, data):
+        self.name = name
+        self.call = call
+        self.start = start
+        self.end = end
+        self.data = data
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return 'Event(%r, %r, duration=%.6f)' % (self.name, self.call,
+                                                 self.duration)
+
+
+class Hooks(object):
+    """Listeners for the events of the calls made through an API.
+
+    Register listeners with API.on(event, callback), which creates the
+    API's Hooks. A listener is called with an Event, in the thread making
+    the call; exceptions it raises are logged and ignored. An API without
+    hooks skips all of this.
+
+    Example:
+        def slow(event):
+            if event.duration > 1:
+                print('slow request', event.call.id, event.call.url)
+
+        api.on('after_response', slow)
+    """
+
+    def __init__(self):
+        self._listeners = dict((event, ()) for event in EVENTS)
+        self._lock = threading.Lock()
+
+    def add(self, event, callback):
+        if event not in self._listeners:
+            raise RingPlusError('Unknown event: %s' % event)
+        with self._lock:
+            self._listeners[event] += (callback,)
+
+    def remove(self, event, callback):
+        with self._lock:
+            self._listeners[event] = tuple(
+                listener for listener in self._listeners[event]
+                if listener != callback)
+
+    def start_call(self, method, url, correlation_id=None):
+        """Return the Call of an APIMethod about to request url."""
+        return Call(correlation_id or new_id(), method.endpoint, url,
+                    method.params, method.headers, method.identity)
+
+    def emit(self, name, call, start, end=None, **data):
+        listeners = self._listeners[name]
+        if not listeners:
+            return
+        event = Event(name, call, start, start if end is None else end, data)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                log.exception('Listener of %s failed', name)
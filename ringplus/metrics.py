@@ -0,0 +1,264 @@
+"""Per-endpoint request metrics with a Prometheus text exporter."""
+
+from __future__ import print_function
+
+import bisect
+import collections
+import threading
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# Request phases timed by the binder:
+#   response: sending the request until the response headers arrived,
+#       including connecting and the server's processing time
+#   transfer: reading the response body
+#   parse: turning the body into models
+PHASES = ('response', 'transfer', 'parse')
+
+
+class Histogram(object):
+    """Counts of observed values per bucket, with their sum."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One extra slot for values above the last bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return [(upper bound, observations <= bound)], +Inf last."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of its bucket."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+
+class Metrics(object):
+    """Request metrics of an API, recorded per endpoint.
+
+    Pass one to API(metrics=...) and every call made through that API
+    records its responses by status, latency histograms for the response,
+    transfer and parse phases, retries by reason, seconds slept by reason,
+    cache lookups and response bytes. Endpoints are named by method and
+    path template, e.g. 'GET /accounts/{account_id}/phone_calls'. An API
+    without metrics skips all of this.
+
+    Example:
+        metrics = Metrics()
+        api = API(auth, metrics=metrics)
+        ...
+        print(metrics.snapshot()['GET /accounts'])
+        metrics.serve(9100)  # scrape with Prometheus
+
+    Args:
+        buckets: Upper bounds of the latency buckets in seconds.
+            default: DEFAULT_BUCKETS
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._requests = collections.Counter()
+            self._latency = {}
+            self._retries = collections.Counter()
+            self._sleeps = collections.Counter()
+            self._cache = collections.Counter()
+            self._bytes = collections.Counter()
+
+    def _observe(self, endpoint, phase, seconds):
+        key = (endpoint, phase)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            histogram = self._latency[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def record_response(self, endpoint, status, response_time,
+                        transfer_time, size):
+        """Record one HTTP response."""
+        with self._lock:
+            self._requests[(endpoint, status)] += 1
+            self._observe(endpoint, 'response', response_time)
+            self._observe(endpoint, 'transfer', transfer_time)
+            self._bytes[endpoint] += size
+
+    def record_parse(self, endpoint, seconds):
+        with self._lock:
+            self._observe(endpoint, 'parse', seconds)
+
+    def record_retry(self, endpoint, reason):
+        """Record a retried request, reason is e.g. 'status_503'."""
+        with self._lock:
+            self._retries[(endpoint, reason)] += 1
+
+    def record_sleep(self, endpoint, reason, seconds):
+        """Record time slept before a request.
+
+        Reasons: 'rate_limit' (waiting for x-rate-limit-reset),
+        'retry_after' (a 429 retry-after), 'retry' (retry_delay) and
+        'budget' (waiting on the API's RateBudget).
+        """
+        with self._lock:
+            self._sleeps[(endpoint, reason)] += seconds
+
+    def record_cache(self, endpoint, result):
+        """Record a cache lookup: 'hit', 'miss' or 'not_modified' (304)."""
+        with self._lock:
+            self._cache[(endpoint, result)] += 1
+
+    def snapshot(self):
+        """Return the metrics recorded so far per endpoint.
+
+        Returns:
+            dict: endpoint -> {'requests': {status: count},
+                'latency': {phase: {'count', 'sum', 'p50', 'p95', 'p99',
+                'buckets'}}, 'retries': {reason: count},
+                'sleep_seconds': {reason: seconds},
+                'cache': {result: count}, 'bytes': int}
+        """
+        result = collections.defaultdict(lambda: {
+            'requests': {}, 'latency': {}, 'retries': {},
+            'sleep_seconds': {}, 'cache': {}, 'bytes': 0})
+        with self._lock:
+            for (endpoint, status), count in self._requests.items():
+                result[endpoint]['requests'][status] = count
+            for (endpoint, phase), histogram in self._latency.items():
+                result[endpoint]['latency'][phase] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.50),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'buckets': histogram.cumulative(),
+                }
+            for (endpoint, reason), count in self._retries.items():
+                result[endpoint]['retries'][reason] = count
+            for (endpoint, reason), seconds in self._sleeps.items():
+                result[endpoint]['sleep_seconds'][reason] = seconds
+            for (endpoint, outcome), count in self._cache.items():
+                result[endpoint]['cache'][outcome] = count
+            for endpoint, size in self._bytes.items():
+                result[endpoint]['bytes'] = size
+        return dict(result)
+
+    def prometheus(self, prefix='ringplus'):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind, description):
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        def sample(name, endpoint, value, **labels):
+            method, path = endpoint.split(' ', 1)
+            pairs = [('method', method), ('path', path)] + \
+                sorted(labels.items())
+            lines.append('%s_%s{%s} %s' % (
+                prefix, name,
+                ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs),
+                _number(value)))
+
+        with self._lock:
+            header('requests_total', 'counter', 'HTTP responses received.')
+            for (endpoint, status), count in sorted(self._requests.items()):
+                sample('requests_total', endpoint, count, status=status)
+
+            header('request_duration_seconds', 'histogram',
+                   'Request latency by phase.')
+            for (endpoint, phase), histogram in sorted(
+                    self._latency.items()):
+                for bound, total in histogram.cumulative():
+                    sample('request_duration_seconds_bucket', endpoint,
+                           total, phase=phase, le=_number(bound))
+                sample('request_duration_seconds_sum', endpoint,
+                       histogram.sum, phase=phase)
+                sample('request_duration_seconds_count', endpoint,
+                       histogram.count, phase=phase)
+
+            header('retries_total', 'counter', 'Requests retried.')
+            for (endpoint, reason), count in sorted(self._retries.items()):
+                sample('retries_total', endpoint, count, reason=reason)
+
+            header('sleep_seconds_total', 'counter',
+                   'Seconds slept before requests.')
+            for (endpoint, reason), seconds in sorted(self._sleeps.items()):
+                sample('sleep_seconds_total', endpoint, seconds,
+                       reason=reason)
+
+            header('cache_lookups_total', 'counter', 'Cache lookups.')
+            for (endpoint, outcome), count in sorted(self._cache.items()):
+                sample('cache_lookups_total', endpoint, count,
+                       result=outcome)
+
+            header('response_bytes_total', 'counter',
+                   'Bytes of response bodies received.')
+            for endpoint, size in sorted(self._bytes.items()):
+                sample('response_bytes_total', endpoint, size)
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host=''):
+        """Serve the Prometheus format on http://host:port/metrics.
+
+        The server runs in a daemon thread; call shutdown() on the returned
+        server to stop it.
+        """
+        from six.moves.BaseHTTPServer import (BaseHTTPRequestHandler,
+                                              HTTPServer)
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -3,6 +3,8 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import threading
+
 import iso8601
 
 from ringplus.error import RingPlusError
@@ -34,6 +36,89 @@ class ResultSet(list):
     def ids(self):
         return [item.id for item in self if hasattr(item, 'id')]
 
+    def load(self, relation, max_workers=8, **kwargs):
+        """Call a relationship accessor of every item concurrently.
+
+        The items share their results, so a request made for one item is
+        not made again for another, e.g. for two accounts with the same
+        id or voicemail box. Calling the accessor with the same arguments
+        afterwards, e.g. while iterating, makes no request.
+
+        Example:
+            accounts = api.accounts(per_page=100)
+            accounts.load('calls', per_page=10)
+            for account in accounts:
+                print(account.id, len(account.calls(per_page=10)))
+
+        Args:
+            relation: Name of the accessor, e.g. 'calls' or 'details'.
+            max_workers: Calls running at once. default: 8
+            kwargs: Passed to the accessor.
+
+        Returns:
+            list: The result of every item, in order. The first error is
+            raised once all calls are done.
+        """
+        if not self:
+            return []
+        from concurrent.futures import ThreadPoolExecutor
+        loader = _Loader()
+        # Items with the same id make the same requests, run one of them
+        keys = []
+        firsts = {}
+        for item in self:
+            loader.adopt(item)
+            key = (type(item), getattr(item, 'id', id(item)))
+            firsts.setdefault(key, item)
+            keys.append(key)
+        with ThreadPoolExecutor(min(max_workers, len(firsts))) as executor:
+            futures = dict((key, executor.submit(getattr(item, relation),
+                                                 **kwargs))
+                           for key, item in firsts.items())
+        return [futures[key].result() for key in keys]
+
+
+class _Loader(object):
+    """Results of the relationship accessors of models, by request.
+
+    Concurrent loads of the same request wait for the first one instead
+    of making it again. Failed loads are not kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def adopt(self, model):
+        """Share the loader with model, keeping what it loaded."""
+        loader = model.__dict__.get('_loader')
+        if loader is self:
+            return
+        if loader is not None:
+            with loader._lock:
+                results = dict(loader._results)
+            with self._lock:
+                for key, result in results.items():
+                    self._results.setdefault(key, result)
+        model._loader = self
+
+    def load(self, key, function, kwargs, refresh=False):
+        from concurrent.futures import Future
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None or (refresh and future.done())
+            if owner:
+                future = self._results[key] = Future()
+        if owner:
+            try:
+                future.set_result(function(**kwargs))
+            except Exception as e:
+                with self._lock:
+                    if self._results.get(key) is future:
+                        del self._results[key]
+                future.set_exception(e)
+        return future.result()
+
 
 class Model(object):
 
@@ -47,6 +132,8 @@ class Model(object):
             del pickle['_api']  # do not pickle the API reference
         except KeyError:
             pass
+        # nor the results of relationship accessors
+        pickle.pop('_loader', None)
         return pickle
 
     def __repr__(self):
@@ -62,6 +149,21 @@ class Model(object):
             setattr(service, k, v)
         return service
 
+    # Names of the relationship accessors, never set from JSON fields
+    RELATIONS = ()
+
+    def _load(self, relation, function, refresh=False, **kwargs):
+        """Return function(**kwargs), called once per set of arguments by
+        the models sharing a loader."""
+        if self._api is None:
+            raise RingPlusError('%s is not bound to an API'
+                                % type(self).__name__)
+        loader = self.__dict__.get('_loader')
+        if loader is None:
+            loader = self.__dict__.setdefault('_loader', _Loader())
+        key = relation + repr(sorted(kwargs.items()))
+        return loader.load(key, function, kwargs, refresh)
+
     @classmethod
     def parse_list(cls, api, json_list):
         """ Parse a list of JSON objects into result set of model instances."""
@@ -84,8 +186,62 @@ class Account(Model):
     Accounts are the object that encapsulate a mobile device on a plan.
     They belong to a User and are a base model for many other routes on
     the API.
+
+    The relationship accessors call the API the account was returned by,
+    and remember their result per set of arguments; pass refresh=True to
+    call again. Use ResultSet.load to call one for a whole list at once.
+    JSON fields named like an accessor are only kept in _json.
     """
 
+    RELATIONS = ('details', 'calls', 'texts', 'data', 'carrier_services',
+                 'fluid_call_credentials', 'voicemail')
+
+    def details(self, **kwargs):
+        """The detailed Account, see API.get_account."""
+        return self._load('details', self._api.get_account,
+                          account_id=self.id, **kwargs)
+
+    def calls(self, **kwargs):
+        """Phone calls of the account, see API.calls."""
+        return self._load('calls', self._api.calls, account_id=self.id,
+                          **kwargs)
+
+    def texts(self, **kwargs):
+        """Texts of the account, see API.texts."""
+        return self._load('texts', self._api.texts, account_id=self.id,
+                          **kwargs)
+
+    def data(self, **kwargs):
+        """Data usage of the account, see API.data."""
+        return self._load('data', self._api.data, account_id=self.id,
+                          **kwargs)
+
+    def carrier_services(self, **kwargs):
+        """See API.enforced_carrier_services."""
+        return self._load('carrier_services',
+                          self._api.enforced_carrier_services,
+                          account_id=self.id, **kwargs)
+
+    def fluid_call_credentials(self, **kwargs):
+        """See API.fluid_call_credentials."""
+        return self._load('fluid_call_credentials',
+                          self._api.fluid_call_credentials,
+                          account_id=self.id, **kwargs)
+
+    def voicemail(self, **kwargs):
+        """Voicemail of the account's voicemail box, see API.voicemail.
+
+        Summary accounts have no voicemail box, so their details are
+        fetched first.
+        """
+        box = getattr(self, 'voicemail_box', None)
+        if box is None:
+            box = getattr(self.details(), 'voicemail_box', None)
+        if box is None:
+            return ResultSet()
+        return self._load('voicemail', self._api.voicemail,
+                          voicemail_box_id=box.id, **kwargs)
+
     @classmethod
     def parse(cls, api, json):
         if 'account' in json:
@@ -94,7 +250,9 @@ class Account(Model):
             account = cls(api)
             setattr(account, '_json', json)
             for k, v in json.items():
-                if k.endswith('_on'):
+                if k in cls.RELATIONS:
+                    continue
+                elif k.endswith('_on'):
                     setattr(account, k, iso8601.parse_date(v))
                 elif k == 'account_services':
                     setattr(account, k, AccountService.parse_list(api, v))
@@ -167,6 +325,14 @@ class User(Model):
     query many other objects in the system.
     """
 
+    RELATIONS = ('accounts_detailed',)
+
+    def accounts_detailed(self, **kwargs):
+        """The user's accounts with their details, see API.user_accounts
+        with expand=True."""
+        return self._load('accounts_detailed', self._api.user_accounts,
+                          user_id=self.id, expand=True, **kwargs)
+
     @classmethod
     def parse(cls, api, json):
         if 'user' in json:
@@ -175,7 +341,9 @@ class User(Model):
             user = cls(api)
             setattr(user, '_json', json)
             for k, v in json.items():
-                if k == 'accounts':
+                if k in cls.RELATIONS:
+                    continue
+                elif k == 'accounts':
                     setattr(user, k, Account.parse_list(api, v))
                 elif k == 'registered_on':
                     setattr(user, k, iso8601.parse_date(v))
@@ -50,7 +50,7 @@ class JSONParser(Parser):
         except Exception as e:
             raise RingPlusError("Failed to parse JSON payload: %s" % e)
 
-        needs_cursors = 'cursor' in method.session.params
+        needs_cursors = 'cursor' in method.params
         if needs_cursors and isinstance(json, dict):
             if 'previous_cursor' in json:
                 if 'next_cursor' in json:
@@ -0,0 +1,260 @@
+"""Polling of device change, phone number change and registration requests."""
+
+from __future__ import print_function
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import six
+
+from ringplus.error import RingPlusError, is_transient
+
+log = logging.getLogger('ringplus.poller')
+
+# Kind of request -> API method returning its status.
+STATUS_METHODS = {
+    'device_change': 'change_device_status',
+    'phone_number_change': 'change_phone_number_status',
+    'account_registration': 'register_account_status',
+}
+
+SUCCESS_STATUSES = ('complete', 'completed', 'success', 'successful',
+                    'succeeded')
+
+TERMINAL_STATUSES = SUCCESS_STATUSES + ('fail', 'failed', 'failure', 'error',
+                                        'rejected', 'cancelled', 'canceled')
+
+
+def is_complete(request):
+    """Return whether a Request reached a terminal state."""
+    completed = getattr(request, 'completed', None)
+    if completed is not None:
+        return bool(completed)
+    status = getattr(request, 'status', None)
+    return isinstance(status, six.string_types) and \
+        status.lower() in TERMINAL_STATUSES
+
+
+def is_successful(request):
+    """Return whether a finished Request succeeded."""
+    status = getattr(request, 'status', None)
+    if isinstance(status, six.string_types):
+        return status.lower() in SUCCESS_STATUSES
+    return bool(getattr(request, 'completed', False)) and \
+        not getattr(request, 'error', None)
+
+
+class _Pending(object):
+
+    __slots__ = ('kind', 'request_id', 'future', 'delay', 'deadline',
+                 'errors')
+
+    def __init__(self, kind, request_id, future, delay, deadline):
+        self.kind = kind
+        self.request_id = request_id
+        self.future = future
+        self.delay = delay
+        self.deadline = deadline
+        self.errors = 0
+
+
+class StatusPoller(object):
+    """Track many outstanding requests until each one completes.
+
+    Every tracked request is polled on its own schedule: the delay between
+    polls grows by backoff up to max_delay, with random jitter so requests
+    submitted together spread out. A single scheduler thread and a small
+    pool of workers serve all requests, however many there are. Polls are
+    regular API calls, so they take from the API's RateBudget if it has one,
+    and dispatching pauses while the token's rate limit is exhausted.
+
+    Leaving a with block waits for every tracked request, or cancels them
+    when the block raised.
+
+    Example:
+        with StatusPoller(api) as poller:
+            futures = [poller.poll('device_change', r.id)
+                       for r in submitted]
+            for future in futures:
+                print(future.result().status)
+
+    Args:
+        api: API instance used to fetch the statuses.
+        max_workers: Polls running at once. default: 4
+        initial_delay: Seconds before the first poll. default: 1
+        max_delay: Largest delay between two polls. default: 60
+        backoff: Factor applied to the delay after each poll. default: 1.5
+        jitter: Fraction of the delay randomly added or removed.
+            default: 0.2
+        timeout: Seconds after which a request is given up with a
+            RingPlusError. default: None (never)
+        max_errors: Consecutive transient errors tolerated per request.
+            default: 5
+        is_complete: Callable telling whether a Request is finished.
+            default: ringplus.poller.is_complete
+    """
+
+    def __init__(self, api, max_workers=4, initial_delay=1.0, max_delay=60.0,
+                 backoff=1.5, jitter=0.2, timeout=None, max_errors=5,
+                 is_complete=is_complete):
+        self.api = api
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self.is_complete = is_complete
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._closed = False
+        self._thread = None
+
+    def poll(self, kind, request_id, callback=None):
+        """Start tracking a request.
+
+        Args:
+            kind: 'device_change', 'phone_number_change' or
+                'account_registration'.
+            request_id: The ID returned when the request was created.
+            callback: Optional callable receiving the finished future.
+
+        Returns:
+            Future: Resolves to the final Request, or fails with the error
+                that stopped the polling.
+        """
+        if kind not in STATUS_METHODS:
+            raise RingPlusError('Unknown request kind: %s' % kind)
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        deadline = time.time() + self.timeout if self.timeout else None
+        pending = _Pending(kind, request_id, future, self.initial_delay,
+                           deadline)
+        with self._cond:
+            if self._closed:
+                raise RingPlusError('Poller is closed')
+            self._schedule(pending, self.initial_delay)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        return future
+
+    def pending(self):
+        """Return the number of requests still being tracked."""
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def close(self, wait=True):
+        """Stop polling. Futures of unfinished requests are cancelled."""
+        with self._cond:
+            self._closed = True
+            abandoned = [entry[2] for entry in self._heap]
+            self._heap = []
+            self._cond.notify_all()
+        for pending in abandoned:
+            pending.future.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leaving the block waits for the tracked requests, unless it is
+        # left by an exception: they are cancelled then, since nobody will
+        # read them and one may never finish.
+        if exc_type is None:
+            with self._cond:
+                while not self._closed and (self._heap or self._in_flight):
+                    self._cond.wait()
+        self.close()
+
+    def _schedule(self, pending, delay):
+        # Called with the condition held.
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        heapq.heappush(self._heap, (time.time() + delay,
+                                    next(self._counter), pending))
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                pending = heapq.heappop(self._heap)[2]
+                self._in_flight += 1
+
+            # Don't burn polls the server will refuse.
+            wait = self.api.rate_limit.wait_time()
+            if wait > 0:
+                log.info('Rate limit exhausted, pausing polls for %ss', wait)
+                time.sleep(wait)
+            with self._cond:
+                # close() may have shut the executor down while sleeping
+                if not self._closed:
+                    try:
+                        self._executor.submit(self._check, pending)
+                        continue
+                    except RuntimeError:
+                        pass
+                self._in_flight -= 1
+                self._cond.notify_all()
+            pending.future.cancel()
+            return
+
+    def _check(self, pending):
+        method = getattr(self.api, STATUS_METHODS[pending.kind])
+        try:
+            statuses = method(request_id=pending.request_id, use_cache=False)
+            request = statuses[0] if isinstance(statuses, list) else statuses
+        except Exception as e:
+            pending.errors += 1
+            if not is_transient(e) or pending.errors > self.max_errors:
+                self._finish(pending, exception=e)
+                return
+            log.info('Polling %s %s failed, retrying: %s', pending.kind,
+                     pending.request_id, e)
+        else:
+            pending.errors = 0
+            if self.is_complete(request):
+                self._finish(pending, result=request)
+                return
+
+        if pending.deadline is not None and time.time() >= pending.deadline:
+            self._finish(pending, exception=RingPlusError(
+                'Timed out waiting for %s request %s' % (pending.kind,
+                                                         pending.request_id)))
+            return
+
+        pending.delay = min(self.max_delay, pending.delay * self.backoff)
+        with self._cond:
+            self._in_flight -= 1
+            if not self._closed:
+                self._schedule(pending, pending.delay)
+                return
+        pending.future.cancel()
+
+    def _finish(self, pending, result=None, exception=None):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+        if exception is not None:
+            pending.future.set_exception(exception)
+        else:
+            pending.future.set_result(result)
@@ -0,0 +1,338 @@
+"""Bulk account registration and device changes."""
+
+from __future__ import print_function
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ringplus.error import RingPlusError
+from ringplus.poller import StatusPoller, is_successful
+
+log = logging.getLogger('ringplus.provisioning')
+
+# action -> (API method creating the request, poller request kind)
+ACTIONS = {
+    'register': ('register_account', 'account_registration'),
+    'change_device': ('change_device', 'device_change'),
+}
+
+SUBMITTED = 'submitted'
+COMPLETED = 'completed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def device_key(row):
+    """Default row key: the device ESN and ICCID."""
+    return '%s/%s' % (row.get('device_esn'), row.get('device_iccid'))
+
+
+class RowResult(object):
+    """Outcome of provisioning one input row."""
+
+    def __init__(self, key, row, state, request_id=None, account_id=None,
+                 account=None, error=None, skipped=False):
+        self.key = key
+        self.row = row
+        self.state = state
+        self.request_id = request_id
+        self.account_id = account_id
+        self.account = account
+        self.error = error
+        # True when the row was already done by an earlier run.
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.state == DONE
+
+    def __repr__(self):
+        return 'RowResult(key=%r, state=%r, request_id=%r, account_id=%r, ' \
+               'error=%r)' % (self.key, self.state, self.request_id,
+                              self.account_id, self.error)
+
+
+class StageStats(object):
+    """Counters and throughput of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, started, ok):
+        ended = time.time()
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.busy_time += ended - started
+            if self.first_start is None or started < self.first_start:
+                self.first_start = started
+            self.last_end = max(self.last_end or ended, ended)
+
+    @property
+    def rows_per_sec(self):
+        if self.first_start is None or self.last_end <= self.first_start:
+            return 0.0
+        return (self.completed + self.failed) / \
+            (self.last_end - self.first_start)
+
+    def __repr__(self):
+        return 'StageStats(name=%r, completed=%d, failed=%d, ' \
+               'rows_per_sec=%.2f)' % (self.name, self.completed,
+                                       self.failed, self.rows_per_sec)
+
+
+class BulkProvisioner(object):
+    """Register accounts or change devices for many rows at once.
+
+    Every row goes through three stages that run concurrently for
+    different rows: submit (create the request), poll (wait for the request
+    to finish, through a StatusPoller) and fetch (get the resulting
+    Account). The state of each row is recorded in the checkpoint as it
+    moves on, so running the same rows again after a crash skips finished
+    rows and resumes polling for submitted ones instead of submitting them
+    a second time. A submitted row is written to disk before its submit
+    worker moves on, so a crash never submits a row twice. The later
+    changes are written together at most every checkpoint_interval seconds;
+    a crash loses at most that much progress, which the next run redoes by
+    polling or fetching again.
+
+    Rows with the same key are provisioned once; their results are the
+    result of the first of them.
+
+    Example:
+        rows = [{'user_id': 1, 'name': 'Phone 1', 'billing_plan_id': 2,
+                 'credit_card_id': 3, 'device_esn': '...',
+                 'device_iccid': '...'}]
+        provisioner = BulkProvisioner(api, 'register',
+                                      JSONCheckpoint('provision.json'))
+        for result in provisioner.run(rows):
+            print(result.key, result.state, result.account_id)
+
+    Args:
+        api: API instance.
+        action: 'register' (API.register_account) or 'change_device'
+            (API.change_device). Rows hold the keyword arguments of the
+            method.
+        checkpoint: Checkpoint recording the state of every row.
+        submit_workers: Requests created at once. default: 4
+        fetch_workers: Accounts fetched at once. default: 4
+        max_in_flight: Rows between submit and done at any time, which
+            bounds memory for long inputs. default: 100
+        poller: StatusPoller to use. default: a new one on the same API
+        key: Callable returning the unique key of a row.
+            default: device_key
+        checkpoint_interval: Seconds between writes of the changes after
+            submission, 0 writes every change at once. default: 1
+    """
+
+    def __init__(self, api, action, checkpoint, submit_workers=4,
+                 fetch_workers=4, max_in_flight=100, poller=None,
+                 key=device_key, checkpoint_interval=1.0):
+        if action not in ACTIONS:
+            raise RingPlusError('Unknown provisioning action: %s' % action)
+        self.api = api
+        self.action = action
+        self.checkpoint = checkpoint
+        self.submit_workers = submit_workers
+        self.fetch_workers = fetch_workers
+        self.max_in_flight = max_in_flight
+        self.poller = poller
+        self.key = key
+        self.checkpoint_interval = checkpoint_interval
+        self.stages = dict((name, StageStats(name))
+                           for name in ('submit', 'poll', 'fetch'))
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+
+    def run(self, rows):
+        """Provision every row and return their RowResults in input order."""
+        own_poller = self.poller is None
+        poller = self.poller or StatusPoller(self.api)
+        submit_pool = ThreadPoolExecutor(self.submit_workers)
+        fetch_pool = ThreadPoolExecutor(self.fetch_workers)
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        futures = []
+        by_key = {}
+        try:
+            for row in rows:
+                key = self.key(row)
+                if key in by_key:
+                    log.warning('Duplicate row %s, provisioning it once',
+                                key)
+                    futures.append(by_key[key])
+                    continue
+                slots.acquire()
+                future = by_key[key] = Future()
+                future.add_done_callback(lambda f: slots.release())
+                futures.append(future)
+                _Row(self, row, future, poller, submit_pool,
+                     fetch_pool).start()
+            return [future.result() for future in futures]
+        finally:
+            submit_pool.shutdown()
+            fetch_pool.shutdown()
+            if own_poller:
+                poller.close()
+            self._flush()
+
+    def _changed(self):
+        """Write the checkpoint soon, with the changes made until then."""
+        if self.checkpoint_interval <= 0:
+            self.checkpoint.save()
+            return
+        with self._save_lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.checkpoint_interval,
+                                               self._flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _flush(self):
+        with self._save_lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.checkpoint.save()
+
+    def stats(self):
+        """Return the StageStats of the submit, poll and fetch stages."""
+        return dict(self.stages)
+
+    def _checkpoint_key(self, key):
+        return 'provision:%s:%s' % (self.action, key)
+
+
+class _Row(object):
+    """Moves one row through the stages of a BulkProvisioner."""
+
+    def __init__(self, provisioner, row, future, poller, submit_pool,
+                 fetch_pool):
+        self.provisioner = provisioner
+        self.row = row
+        self.future = future
+        self.poller = poller
+        self.submit_pool = submit_pool
+        self.fetch_pool = fetch_pool
+        self.key = provisioner.key(row)
+        self.checkpoint_key = provisioner._checkpoint_key(self.key)
+        self.state = provisioner.checkpoint.get(self.checkpoint_key) or {}
+
+    def start(self):
+        state = self.state.get('state')
+        if state == DONE:
+            self._resolve(DONE, skipped=True)
+        elif state == SUBMITTED:
+            log.info('Resuming polling of %s', self.key)
+            self._poll()
+        elif state == COMPLETED:
+            self.fetch_pool.submit(self._fetch)
+        else:
+            self.submit_pool.submit(self._submit)
+
+    def _save(self, durable=False, **state):
+        # durable writes the checkpoint before returning, the other changes
+        # are written with the next batch.
+        self.state = state
+        self.provisioner.checkpoint.set(self.checkpoint_key, state,
+                                        save=durable)
+        if not durable:
+            self.provisioner._changed()
+
+    def _submit(self):
+        stats = self.provisioner.stages['submit']
+        started = time.time()
+        method = getattr(self.provisioner.api,
+                         ACTIONS[self.provisioner.action][0])
+        try:
+            request = method(**self.row)
+        except Exception as e:
+            stats.record(started, False)
+            self._fail(e)
+            return
+        stats.record(started, True)
+        try:
+            self._save(state=SUBMITTED, request_id=request.id, durable=True)
+        except Exception as e:
+            log.error('Could not checkpoint request %s of %s: %s',
+                      request.id, self.key, e)
+            self.state = {'state': SUBMITTED, 'request_id': request.id}
+            self._resolve(FAILED, error=e)
+            return
+        self._poll()
+
+    def _poll(self):
+        started = time.time()
+        try:
+            self.poller.poll(ACTIONS[self.provisioner.action][1],
+                             self.state['request_id'],
+                             callback=lambda f: self._polled(f, started))
+        except Exception as e:
+            self._fail(e)
+
+    def _polled(self, future, started):
+        stats = self.provisioner.stages['poll']
+        try:
+            request = future.result()
+        except Exception as e:
+            stats.record(started, False)
+            self._fail(e)
+            return
+        if not is_successful(request):
+            stats.record(started, False)
+            self._fail(RingPlusError('Request %s finished with status %s'
+                                     % (request.id,
+                                        getattr(request, 'status', None))))
+            return
+        stats.record(started, True)
+        account = getattr(request, 'account', None)
+        account_id = account.id if account is not None else \
+            getattr(request, 'account_id', None)
+        self._save(state=COMPLETED, request_id=self.state['request_id'],
+                   account_id=account_id)
+        try:
+            self.fetch_pool.submit(self._fetch)
+        except Exception as e:
+            self._fail(e)
+
+    def _fetch(self):
+        stats = self.provisioner.stages['fetch']
+        started = time.time()
+        account_id = self.state.get('account_id') or \
+            self.row.get('account_id')
+        try:
+            account = self.provisioner.api.get_account(account_id=account_id)
+        except Exception as e:
+            stats.record(started, False)
+            self._fail(e)
+            return
+        stats.record(started, True)
+        self._save(state=DONE, request_id=self.state.get('request_id'),
+                   account_id=account_id)
+        self._resolve(DONE, account=account)
+
+    def _fail(self, error):
+        log.warning('Provisioning %s failed: %s', self.key, error)
+        # A submitted or completed request must not be submitted again, a
+        # rerun resumes polling or fetching it instead.
+        if self.state.get('state') not in (SUBMITTED, COMPLETED):
+            self._save(state=FAILED, error=str(error),
+                       request_id=self.state.get('request_id'))
+        self._resolve(FAILED, error=error)
+
+    def _resolve(self, state, account=None, error=None, skipped=False):
+        self.future.set_result(RowResult(
+            self.key, self.row, state,
+            request_id=self.state.get('request_id'),
+            account_id=self.state.get('account_id'),
+            account=account, error=error, skipped=skipped))
@@ -0,0 +1,101 @@
+"""Rate limit accounting for RingPlus access tokens."""
+
+from __future__ import print_function
+
+import threading
+import time
+
+
+class RateLimit(object):
+    """Remaining calls and reset time reported for one access token.
+
+    Updated from the x-rate-limit-* headers of every response made with the
+    token and shared by all calls using it.
+
+    Args:
+        lock: Lock guarding the state. Registries holding many instances
+            pass a shared one. default: a new lock
+    """
+
+    __slots__ = ('remaining', 'reset', '_lock')
+
+    def __init__(self, lock=None):
+        self.remaining = None
+        self.reset = None
+        self._lock = lock or threading.Lock()
+
+    def update(self, headers):
+        """Update the state from the headers of a response."""
+        with self._lock:
+            remaining = headers.get('x-rate-limit-remaining')
+            if remaining is not None:
+                self.remaining = int(remaining)
+            elif isinstance(self.remaining, int):
+                self.remaining -= 1
+            reset = headers.get('x-rate-limit-reset')
+            if reset is not None:
+                self.reset = int(reset)
+
+    def wait_time(self):
+        """Seconds until calls are available again, 0 if they are now."""
+        with self._lock:
+            if self.reset is None or self.remaining is None or \
+                    self.remaining >= 1:
+                return 0
+            return max(0, self.reset - int(time.time()))
+
+    def __repr__(self):
+        return 'RateLimit(remaining=%r, reset=%r)' % (self.remaining,
+                                                      self.reset)
+
+
+class RateBudget(object):
+    """Client side token bucket shared by all requests of an API.
+
+    Pass one to API(rate_budget=...) to cap the request rate of everything
+    using that API instance (plain calls as well as pollers, bulk jobs and
+    schedulers), so background work cannot use up the server's rate limit.
+
+    Args:
+        rate: Requests allowed per second on average.
+        burst: Requests that may be made at once after idling.
+            default: rate, at least 1
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available without waiting; return success."""
+        with self._lock:
+            self._refill(time.time())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Take tokens, sleeping until they are available.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.time())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,198 @@
+"""Concurrent, fair fan-out of per-account work."""
+
+from __future__ import print_function
+
+import collections
+import logging
+import threading
+import time
+
+from ringplus.cursor import Cursor
+
+log = logging.getLogger('ringplus.scheduler')
+
+
+class AccountProgress(object):
+    """Progress and throughput of the work of a single account."""
+
+    def __init__(self, key):
+        self.key = key
+        self.steps = 0
+        self.items = 0
+        self.busy_time = 0.0
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def items_per_sec(self):
+        end = self.finished or time.time()
+        if self.started is None or end <= self.started:
+            return 0.0
+        return self.items / (end - self.started)
+
+    def copy(self):
+        progress = AccountProgress(self.key)
+        progress.__dict__.update(self.__dict__)
+        return progress
+
+    def __repr__(self):
+        return 'AccountProgress(key=%r, steps=%d, items=%d, done=%r, ' \
+               'error=%r)' % (self.key, self.steps, self.items, self.done,
+                              self.error)
+
+
+def pages_of(method, **kwargs):
+    """Return a work function walking the pages of a paged method.
+
+    Example:
+        scheduler.run(api.accounts(), pages_of(api.calls, per_page=100))
+    """
+    def work(account):
+        return Cursor(method, account_id=account.id, **kwargs).pages()
+    return work
+
+
+class FanOutScheduler(object):
+    """Run per-account work concurrently with round-robin fairness.
+
+    The work for an account is an iterator; every next() call is one unit
+    of work, typically one API request such as fetching a page. At most one
+    unit per account runs at a time, so the units of an account are
+    executed and delivered in order. After each unit the account goes to
+    the back of the queue, so an account with a very long history only
+    gets its share of the workers and cannot starve the others.
+
+    Example:
+        def on_page(account, calls):
+            store.ingest('calls', account.id, calls)
+
+        scheduler = FanOutScheduler(max_workers=8, on_result=on_page)
+        scheduler.run(api.accounts(), pages_of(api.calls, per_page=100))
+
+    Args:
+        max_workers: Global limit on concurrently running units.
+            default: 8
+        on_result: Callable receiving (account, result) for every unit.
+            It is called from the worker threads.
+        on_error: Callable receiving (account, exception) when the work of
+            an account fails. The other accounts carry on.
+    """
+
+    def __init__(self, max_workers=8, on_result=None, on_error=None):
+        self.max_workers = max_workers
+        self.on_result = on_result
+        self.on_error = on_error
+        self._cond = threading.Condition()
+        self._ready = collections.deque()
+        self._running = 0
+        self._progress = collections.OrderedDict()
+
+    def run(self, accounts, work):
+        """Run work(account) for every account and wait for completion.
+
+        Returns:
+            dict: Account key -> AccountProgress.
+        """
+        with self._cond:
+            for account in accounts:
+                key = getattr(account, 'id', account)
+                self._progress[key] = AccountProgress(key)
+                self._ready.append((account, key, None, work))
+
+        threads = [threading.Thread(target=self._worker)
+                   for _ in range(self.max_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.progress()
+
+    def progress(self):
+        """Return a snapshot of the progress of every account."""
+        with self._cond:
+            return collections.OrderedDict(
+                (key, progress.copy())
+                for key, progress in self._progress.items())
+
+    def stats(self):
+        """Return totals across all accounts."""
+        snapshot = self.progress().values()
+        started = [p.started for p in snapshot if p.started is not None]
+        finished = [p.finished for p in snapshot if p.finished is not None]
+        items = sum(p.items for p in snapshot)
+        end = max(finished) if len(finished) == len(snapshot) and finished \
+            else time.time()
+        elapsed = end - min(started) if started else 0.0
+        return {'accounts': len(snapshot),
+                'done': len(finished),
+                'failed': sum(1 for p in snapshot if p.error is not None),
+                'steps': sum(p.steps for p in snapshot),
+                'items': items,
+                'items_per_sec': items / elapsed if elapsed else 0.0}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and self._running:
+                    self._cond.wait()
+                if not self._ready:
+                    # Nothing queued and nothing running that could requeue.
+                    self._cond.notify_all()
+                    return
+                account, key, iterator, work = self._ready.popleft()
+                self._running += 1
+                progress = self._progress[key]
+                if progress.started is None:
+                    progress.started = time.time()
+
+            requeue = False
+            began = time.time()
+            try:
+                try:
+                    if iterator is None:
+                        iterator = iter(work(account))
+                    result = next(iterator)
+                except StopIteration:
+                    pass
+                except Exception as e:
+                    self._fail(account, key, progress, e)
+                else:
+                    with self._cond:
+                        progress.steps += 1
+                        try:
+                            progress.items += len(result)
+                        except TypeError:
+                            progress.items += 1
+                    try:
+                        if self.on_result:
+                            self.on_result(account, result)
+                        requeue = True
+                    except Exception as e:
+                        self._fail(account, key, progress, e)
+            finally:
+                # Always release the slot, or the other workers wait for
+                # this one forever.
+                with self._cond:
+                    progress.busy_time += time.time() - began
+                    self._running -= 1
+                    if requeue:
+                        self._ready.append((account, key, iterator, work))
+                    else:
+                        progress.finished = time.time()
+                    self._cond.notify_all()
+
+    def _fail(self, account, key, progress, error):
+        log.warning('Work for account %s failed: %s', key, error)
+        with self._cond:
+            progress.error = error
+        if self.on_error:
+            try:
+                self.on_error(account, error)
+            except Exception:
+                log.exception('on_error failed for account %s', key)
@@ -0,0 +1,296 @@
+"""Local SQLite warehouse for usage records."""
+
+from __future__ import print_function
+
+import calendar
+import logging
+import sqlite3
+import threading
+
+import iso8601
+
+from ringplus.error import RingPlusError
+from ringplus.models import Model, ModelFactory, ResultSet
+from ringplus.utils import import_simplejson
+
+json = import_simplejson()
+
+log = logging.getLogger('ringplus.store')
+
+
+class _Table(object):
+    """Describes how one kind of usage record is stored."""
+
+    def __init__(self, name, payload_type, owner, timestamp, numbers):
+        self.name = name
+        self.payload_type = payload_type
+        # Column holding the id of the object the record belongs to.
+        self.owner = owner
+        # Attribute of the record holding its timestamp.
+        self.timestamp = timestamp
+        # Candidate attributes holding the counterparty number, in order.
+        self.numbers = numbers
+
+
+TABLES = {
+    'calls': _Table('calls', 'call', 'account_id', 'start_time',
+                    ('number', 'to_number', 'from_number', 'phone_number')),
+    'texts': _Table('texts', 'text', 'account_id', 'occurred_at',
+                    ('number', 'to_number', 'from_number', 'phone_number')),
+    'data': _Table('data', 'data', 'account_id', 'occurred_at', ()),
+    'voicemail': _Table('voicemail', 'voicemail', 'voicemail_box_id',
+                        'received_on',
+                        ('caller_id', 'from_number', 'number',
+                         'phone_number')),
+}
+
+
+def _epoch(value):
+    """Convert a datetime or iso 8601 string into a UTC unix timestamp."""
+    if value is None:
+        return None
+    if not hasattr(value, 'utctimetuple'):
+        value = iso8601.parse_date(value)
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _json_of(record):
+    if isinstance(record, Model):
+        return record._json
+    return record
+
+
+class UsageStore(object):
+    """Store usage records locally and answer API style queries offline.
+
+    Records are kept as their original JSON next to a few indexed columns
+    (owner id, timestamp and counterparty number). Query methods mirror the
+    signatures of the matching API methods and return the same models.
+
+    Example:
+        store = UsageStore('usage.db')
+        store.ingest('calls', account_id, api.calls(account_id))
+        calls = store.calls(account_id, start_date=last_week)
+
+    Args:
+        path: Path to the SQLite database, or ':memory:'.
+        model_factory: Factory used to build models from stored records.
+            default: ringplus.models.ModelFactory
+        api: API instance attached to the returned models. default: None
+    """
+
+    def __init__(self, path, model_factory=None, api=None):
+        self.path = path
+        self.model_factory = model_factory or ModelFactory
+        self.api = api
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self.connection:
+            for table in TABLES.values():
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {0} ('
+                    ' id TEXT NOT NULL,'
+                    ' {1} TEXT NOT NULL,'
+                    ' ts REAL,'
+                    ' number TEXT,'
+                    ' json TEXT NOT NULL,'
+                    ' PRIMARY KEY ({1}, id))'.format(table.name, table.owner))
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS {0}_owner_ts '
+                    'ON {0} ({1}, ts)'.format(table.name, table.owner))
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS {0}_number '
+                    'ON {0} (number)'.format(table.name))
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS accounts ('
+                ' id TEXT PRIMARY KEY,'
+                ' user_id TEXT,'
+                ' name TEXT,'
+                ' email_address TEXT,'
+                ' phone_number TEXT,'
+                ' json TEXT NOT NULL)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS accounts_user '
+                'ON accounts (user_id)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS accounts_phone_number '
+                'ON accounts (phone_number)')
+
+    def close(self):
+        self.connection.close()
+
+    # Ingestion
+
+    def ingest(self, kind, owner_id, records, batch_size=10000):
+        """Store usage records in bulk transactions.
+
+        Args:
+            kind: One of 'calls', 'texts', 'data' or 'voicemail'.
+            owner_id: The account id, or the voicemail box id for voicemail.
+            records: Iterable of models or of their JSON dictionaries.
+            batch_size: Number of records written per transaction.
+
+        Returns:
+            int: Number of records written.
+        """
+        try:
+            table = TABLES[kind]
+        except KeyError:
+            raise RingPlusError('Unknown record kind: %s' % kind)
+
+        sql = 'INSERT OR REPLACE INTO {0} (id, {1}, ts, number, json) ' \
+              'VALUES (?, ?, ?, ?, ?)'.format(table.name, table.owner)
+        owner_id = str(owner_id)
+        count = 0
+        batch = []
+        for record in records:
+            data = _json_of(record)
+            number = None
+            for key in table.numbers:
+                if data.get(key):
+                    number = str(data[key])
+                    break
+            batch.append((str(data['id']), owner_id,
+                          _epoch(data.get(table.timestamp)), number,
+                          json.dumps(data)))
+            if len(batch) >= batch_size:
+                count += self._write(sql, batch)
+                batch = []
+        if batch:
+            count += self._write(sql, batch)
+        return count
+
+    def ingest_accounts(self, accounts, batch_size=10000):
+        """Store Account models (or their JSON dictionaries) in bulk."""
+        sql = 'INSERT OR REPLACE INTO accounts ' \
+              '(id, user_id, name, email_address, phone_number, json) ' \
+              'VALUES (?, ?, ?, ?, ?, ?)'
+        count = 0
+        batch = []
+        for account in accounts:
+            data = _json_of(account)
+            if 'account' in data:
+                data = data['account']
+            batch.append((str(data['id']), _str_or_none(data.get('user_id')),
+                          data.get('name'), data.get('email_address'),
+                          _str_or_none(data.get('phone_number')),
+                          json.dumps(data)))
+            if len(batch) >= batch_size:
+                count += self._write(sql, batch)
+                batch = []
+        if batch:
+            count += self._write(sql, batch)
+        return count
+
+    def _write(self, sql, rows):
+        with self._lock, self.connection:
+            self.connection.executemany(sql, rows)
+        return len(rows)
+
+    # Queries
+
+    def calls(self, account_id, start_date=None, end_date=None, per_page=25,
+              page=1):
+        """Return an account's stored phone calls, newest first."""
+        return self._usage('calls', account_id, start_date, end_date,
+                           per_page, page)
+
+    def texts(self, account_id, start_date=None, end_date=None, per_page=25,
+              page=1):
+        """Return an account's stored phone texts, newest first."""
+        return self._usage('texts', account_id, start_date, end_date,
+                           per_page, page)
+
+    def data(self, account_id, start_date=None, end_date=None, per_page=25,
+             page=1):
+        """Return an account's stored phone data records, newest first."""
+        return self._usage('data', account_id, start_date, end_date,
+                           per_page, page)
+
+    def voicemail(self, voicemail_box_id, only_new=None, per_page=25, page=1):
+        """Return a voicemail box's stored messages, newest first."""
+        table = TABLES['voicemail']
+        where = ['voicemail_box_id = ?']
+        args = [str(voicemail_box_id)]
+        if only_new:
+            where.append("json_extract(json, '$.is_new') = 1")
+        return self._select(table.name, table.payload_type, where, args,
+                            per_page, page, order='ts DESC, id DESC')
+
+    def by_number(self, kind, number, per_page=25, page=1):
+        """Return stored records of any owner exchanged with a number."""
+        table = TABLES[kind]
+        return self._select(table.name, table.payload_type, ['number = ?'],
+                            [str(number)], per_page, page,
+                            order='ts DESC, id DESC')
+
+    def accounts(self, name=None, email_address=None, phone_number=None,
+                 page=1, per_page=25):
+        """Return stored accounts, filtered like API.accounts."""
+        where = []
+        args = []
+        for column, value in (('name', name),
+                              ('email_address', email_address),
+                              ('phone_number', phone_number)):
+            if value is not None:
+                where.append('%s = ?' % column)
+                args.append(str(value))
+        return self._select('accounts', 'account', where, args, per_page,
+                            page, order='id')
+
+    def user_accounts(self, user_id, page=1, per_page=25):
+        """Return the stored accounts of a user."""
+        return self._select('accounts', 'account', ['user_id = ?'],
+                            [str(user_id)], per_page, page, order='id')
+
+    def get_account(self, account_id):
+        """Return a stored account or None."""
+        results = self._select('accounts', 'account', ['id = ?'],
+                               [str(account_id)], 1, 1, order='id')
+        return results[0] if results else None
+
+    def count(self, kind):
+        """Return the number of stored records of a kind."""
+        name = 'accounts' if kind == 'accounts' else TABLES[kind].name
+        with self._lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM %s' % name).fetchone()[0]
+
+    def _usage(self, kind, account_id, start_date, end_date, per_page, page):
+        table = TABLES[kind]
+        where = ['account_id = ?']
+        args = [str(account_id)]
+        if start_date is not None:
+            where.append('ts >= ?')
+            args.append(_epoch(start_date))
+        if end_date is not None:
+            where.append('ts <= ?')
+            args.append(_epoch(end_date))
+        return self._select(table.name, table.payload_type, where, args,
+                            per_page, page, order='ts DESC, id DESC')
+
+    def _select(self, name, payload_type, where, args, per_page, page,
+                order):
+        sql = 'SELECT json FROM %s' % name
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY %s LIMIT ? OFFSET ?' % order
+        per_page = int(per_page)
+        args = list(args) + [per_page, (int(page) - 1) * per_page]
+        with self._lock:
+            rows = self.connection.execute(sql, args).fetchall()
+
+        model = getattr(self.model_factory, payload_type)
+        results = ResultSet()
+        for (data,) in rows:
+            results.append(model.parse(self.api, json.loads(data)))
+        return results
+
+
+def _str_or_none(value):
+    return str(value) if value is not None else None
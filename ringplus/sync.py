@@ -0,0 +1,150 @@
+"""Incremental synchronisation of account usage records."""
+
+from __future__ import print_function
+
+import datetime
+import logging
+
+import iso8601
+
+from ringplus.error import RingPlusError
+
+log = logging.getLogger('ringplus.sync')
+
+# Stream name (API method) -> the timestamp attribute of its records.
+STREAMS = {
+    'calls': 'start_time',
+    'texts': 'occurred_at',
+    'data': 'occurred_at',
+}
+
+
+def _format_time(value):
+    return value.isoformat() if value is not None else None
+
+
+def _parse_time(value):
+    return iso8601.parse_date(value) if value is not None else None
+
+
+class SyncEngine(object):
+    """Fetch only the usage records that have not been seen before.
+
+    A high-watermark (latest timestamp and its record id) is kept per
+    account and stream. Each run asks for records starting at the watermark
+    minus the overlap window, so records that arrive late are still picked
+    up, and drops records whose id was already delivered.
+
+    Progress is written to the checkpoint after every page. If a run is
+    interrupted, the next run for the same account and stream resumes at
+    the page where it stopped instead of starting over.
+
+    Args:
+        api: API instance used to fetch the records.
+        checkpoint: Checkpoint used to persist the watermarks, usually a
+            ringplus.checkpoint.JSONCheckpoint.
+        overlap (timedelta): How far before the watermark to look for late
+            records. default: 1 hour
+        per_page: Page size to request. default: 100
+        streams: Names of the streams to sync, any of 'calls', 'texts' and
+            'data'. default: all of them
+    """
+
+    def __init__(self, api, checkpoint, overlap=datetime.timedelta(hours=1),
+                 per_page=100, streams=None):
+        self.api = api
+        self.checkpoint = checkpoint
+        self.overlap = overlap
+        self.per_page = per_page
+        self.streams = streams or sorted(STREAMS)
+        for stream in self.streams:
+            if stream not in STREAMS:
+                raise RingPlusError('Unknown stream: %s' % stream)
+
+    def sync(self, account_id, streams=None):
+        """Yield (stream, record) for every new record of an account."""
+        for stream in streams or self.streams:
+            for record in self.sync_stream(account_id, stream):
+                yield stream, record
+
+    def sync_stream(self, account_id, stream):
+        """Yield the new records of a single stream of an account.
+
+        The checkpoint is updated once all records of a page have been
+        consumed, so a record is only acknowledged after the caller handled
+        it.
+        """
+        key = self._key(account_id, stream)
+        field = STREAMS[stream]
+        method = getattr(self.api, stream)
+
+        state = self.checkpoint.get(key) or {}
+        run = state.get('run')
+        if run is None:
+            watermark = _parse_time(state.get('watermark'))
+            since = watermark - self.overlap if watermark else None
+            run = {'since': _format_time(since),
+                   'page': 1,
+                   'watermark': state.get('watermark'),
+                   'watermark_id': state.get('watermark_id'),
+                   # Ids delivered by earlier runs, inside the overlap
+                   'prior': state.get('seen', []),
+                   'seen': []}
+        else:
+            log.info('Resuming %s at page %s', key, run['page'])
+
+        since = _parse_time(run['since'])
+        watermark = _parse_time(run['watermark'])
+        prior = dict((record_id, _parse_time(ts)) for record_id, ts in
+                     run.get('prior', []))
+        seen = dict((record_id, _parse_time(ts)) for record_id, ts in
+                    run['seen'])
+
+        while True:
+            results = method(account_id=account_id, start_date=since,
+                             page=run['page'], per_page=self.per_page)
+            for record in results:
+                record_id = getattr(record, 'id', None)
+                if record_id in seen or record_id in prior:
+                    continue
+                timestamp = getattr(record, field, None)
+                seen[record_id] = timestamp
+                if timestamp is not None and \
+                        (watermark is None or timestamp > watermark):
+                    watermark = timestamp
+                    run['watermark_id'] = record_id
+                yield record
+
+            run['page'] += 1
+            run['watermark'] = _format_time(watermark)
+            # Pages do not overlap, so only the ids the next run can see
+            # again are kept, which keeps each save small.
+            run['seen'] = self._recent(seen, watermark)
+            if len(results) < self.per_page:
+                break
+            self.checkpoint.set(key, dict(state, run=run))
+
+        seen.update(prior)
+        self.checkpoint.set(key, {'watermark': run['watermark'],
+                                  'watermark_id': run['watermark_id'],
+                                  'seen': self._recent(seen, watermark)})
+
+    def _recent(self, seen, watermark):
+        """Return the [id, timestamp] pairs inside the overlap window."""
+        # Only ids inside the next run's overlap window can show up again.
+        horizon = watermark - self.overlap if watermark else None
+        return [[record_id, _format_time(ts)]
+                for record_id, ts in seen.items()
+                if horizon is None or ts is None or ts >= horizon]
+
+    def watermark(self, account_id, stream):
+        """Return the (timestamp, id) watermark of a stream, if any."""
+        state = self.checkpoint.get(self._key(account_id, stream)) or {}
+        return _parse_time(state.get('watermark')), state.get('watermark_id')
+
+    def reset(self, account_id, stream):
+        """Forget the watermark so the next run fetches the full history."""
+        self.checkpoint.delete(self._key(account_id, stream))
+
+    def _key(self, account_id, stream):
+        return '%s/%s' % (account_id, stream)
@@ -0,0 +1,143 @@
+"""Persistent storage of OAuth tokens shared between processes."""
+
+from __future__ import print_function
+
+import os
+import sqlite3
+import threading
+
+from ringplus.utils import atomic_write, import_simplejson
+
+json = import_simplejson()
+
+
+class TokenStore(object):
+    """Where an OAuthHandler keeps its tokens between runs.
+
+    Tokens are stored under a key, by default derived from the client id
+    and the username used to login.
+    """
+
+    def load(self, key):
+        """Return the stored token dictionary or None."""
+        raise NotImplementedError
+
+    def save(self, key, token):
+        """Persist a token dictionary."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Forget a stored token."""
+        raise NotImplementedError
+
+
+class FileTokenStore(TokenStore):
+    """Keep tokens in a JSON file.
+
+    Writes replace the file atomically, so processes reading it concurrently
+    see either the old or the new tokens. Writers on POSIX systems also take
+    an exclusive lock on a side file so concurrent updates are not lost.
+
+    Args:
+        path: Location of the token file. It should only be readable by
+            the user running the application.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        return self._read().get(key)
+
+    def save(self, key, token):
+        with self._locked():
+            tokens = self._read()
+            tokens[key] = token
+            self._write(tokens)
+
+    def delete(self, key):
+        with self._locked():
+            tokens = self._read()
+            if tokens.pop(key, None) is not None:
+                self._write(tokens)
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+        except IOError:
+            return {}
+        return json.loads(content.decode('utf-8')) if content else {}
+
+    def _write(self, tokens):
+        atomic_write(self.path, json.dumps(tokens).encode('utf-8'))
+        os.chmod(self.path, 0o600)
+
+    def _locked(self):
+        return _FileLock(self.path + '.lock', self._lock)
+
+
+class _FileLock(object):
+    """Exclusive lock between threads and, where fcntl exists, processes."""
+
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            import fcntl
+        except ImportError:
+            return self
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            # Closing the file releases the flock.
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+class SQLiteTokenStore(TokenStore):
+    """Keep tokens in an SQLite database.
+
+    SQLite transactions make updates atomic and safe between processes
+    sharing the database file.
+
+    Args:
+        path: Location of the database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False)
+        with self._lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS tokens ('
+                ' key TEXT PRIMARY KEY,'
+                ' token TEXT NOT NULL)')
+
+    def load(self, key):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT token FROM tokens WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key, token):
+        with self._lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO tokens (key, token) VALUES (?, ?)',
+                (key, json.dumps(token)))
+
+    def delete(self, key):
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM tokens WHERE key = ?',
+                                    (key,))
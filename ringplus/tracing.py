@@ -0,0 +1,289 @@
+"""Tracing of API calls as nested spans, built from hook events."""
+
+from __future__ import print_function
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from ringplus.error import RingPlusError
+from ringplus.hooks import EVENTS, new_id
+
+log = logging.getLogger('ringplus.tracing')
+
+# Span name of the hook events that have a duration
+SPAN_NAMES = {
+    'after_auth': 'auth',
+    'after_response': 'http',
+    'on_rate_limit_wait': 'rate_limit_wait',
+    'on_retry': 'retry_sleep',
+    'after_parse_error': 'parse_error',
+    'after_parse': 'parse',
+    'after_cache_store': 'cache_store',
+}
+
+# Where the time of each span goes, see Span.breakdown
+CATEGORIES = {
+    'auth': 'auth',
+    'http': 'network',
+    'rate_limit_wait': 'throttling',
+    'retry_sleep': 'throttling',
+    'parse_error': 'parse',
+    'parse': 'parse',
+    'cache_store': 'cache',
+}
+
+
+class Span(object):
+    """A timed operation, with the operations it contains as children.
+
+    Attributes:
+        name: The endpoint for API calls, e.g. 'GET /accounts', a phase of
+            the call ('auth', 'http', 'parse', ...) or a name given to
+            Tracer.span.
+        trace_id: Shared by all spans of a trace. For a call made outside
+            any other span this is the call's correlation id.
+        span_id, parent_id: Ids of the span and of its parent.
+        start, end: Timestamps (time.time()).
+        attributes: Dict of str, int, float or bool values.
+        error: The exception that ended the span, if any.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end',
+                 'attributes', 'children', 'error')
+
+    def __init__(self, name, trace_id, parent=None, start=None,
+                 attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = attributes or {}
+        self.children = []
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def walk(self):
+        """Yield this span and all its descendants, depth first."""
+        yield self
+        for child in self.children:
+            for span in child.walk():
+                yield span
+
+    def breakdown(self):
+        """Return the seconds spent per category below this span.
+
+        Categories are 'network', 'throttling', 'parse', 'auth' and
+        'cache'; 'other' is the rest of this span's duration, such as
+        building the request or time in listeners.
+        """
+        result = dict((category, 0.0) for category in
+                      set(CATEGORIES.values()))
+        for span in self.walk():
+            category = CATEGORIES.get(span.name)
+            if category is not None:
+                result[category] += span.duration
+        result['other'] = max(0.0, self.duration - sum(result.values()))
+        return result
+
+    def format(self, indent=0):
+        """Return the span tree as indented text, one span per line."""
+        attributes = ' '.join('%s=%s' % item for item in
+                              sorted(self.attributes.items()))
+        line = '%s%s %.1fms %s' % ('  ' * indent, self.name,
+                                   self.duration * 1000, attributes)
+        if self.error is not None:
+            line += ' error=%r' % self.error
+        lines = [line.rstrip()]
+        for child in self.children:
+            lines.append(child.format(indent + 1))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'name': self.name, 'trace_id': self.trace_id,
+                'span_id': self.span_id, 'parent_id': self.parent_id,
+                'start': self.start, 'end': self.end,
+                'attributes': dict(self.attributes),
+                'error': repr(self.error) if self.error else None,
+                'children': [child.to_dict() for child in self.children]}
+
+    def __repr__(self):
+        return 'Span(%r, trace_id=%r, duration=%.6f)' % (
+            self.name, self.trace_id, self.duration)
+
+
+class Tracer(object):
+    """Record API calls as spans, nested under the caller's own spans.
+
+    Every call made through an API the tracer is installed on becomes a
+    span named after its endpoint, with children for authentication, each
+    HTTP attempt, rate limit waits, retry sleeps, parsing and the cache
+    store. Calls made inside a Tracer.span block on the same thread, or
+    given the parent explicitly, are nested under it. Finished top level
+    spans are kept (the last keep of them) and passed to every exporter.
+
+    Example:
+        tracer = Tracer(exporters=[OpenTelemetryExporter()])
+        tracer.install(api)
+        with tracer.span('dashboard', user=user_id):
+            api.user_accounts(user_id=user_id)
+        trace = tracer.finished()[-1]
+        print(trace.format())
+        print(trace.breakdown())  # network vs parse vs throttling
+
+    Args:
+        exporters: Callables called with each finished top level Span.
+        header: Request header to send the correlation id in, e.g.
+            'X-Request-Id'. default: None, not sent
+        keep: Finished top level spans kept for finished(). default: 100
+    """
+
+    def __init__(self, exporters=(), header=None, keep=100):
+        self.exporters = list(exporters)
+        self.header = header
+        self._finished = collections.deque(maxlen=keep)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install(self, api):
+        """Start tracing the calls made through api."""
+        for event in EVENTS:
+            api.on(event, self._on_event)
+        return self
+
+    def uninstall(self, api):
+        for event in EVENTS:
+            api.off(event, self._on_event)
+
+    def current(self):
+        """Return the innermost open Tracer.span of this thread, or None."""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, **attributes):
+        """Open a span around a block of code.
+
+        API calls made in the block on this thread become its children.
+        Pass parent to continue a span opened on another thread, e.g. in
+        the workers of a FanOutScheduler.
+        """
+        if parent is None:
+            parent = self.current()
+        trace_id = parent.trace_id if parent is not None else new_id()
+        span = Span(name, trace_id, parent, attributes=attributes)
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = e
+            raise
+        finally:
+            stack.pop()
+            self._close(span, parent)
+
+    def finished(self):
+        """Return the finished top level spans, oldest first."""
+        with self._lock:
+            return list(self._finished)
+
+    def _close(self, span, parent):
+        span.end = time.time()
+        if parent is not None:
+            with self._lock:
+                parent.children.append(span)
+            return
+        with self._lock:
+            self._finished.append(span)
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception:
+                log.exception('Exporting span %s failed', span.name)
+
+    def _on_event(self, event):
+        call = event.call
+        if event.name == 'before_call':
+            parent = self.current()
+            trace_id = parent.trace_id if parent is not None else call.id
+            call.data[self] = (Span(call.endpoint, trace_id, parent,
+                                    start=event.start,
+                                    attributes={'url': call.url,
+                                                'correlation_id': call.id}),
+                               parent)
+            return
+        if self not in call.data:
+            # Installed while the call was running
+            return
+        root, parent = call.data[self]
+        if event.name == 'after_call':
+            root.error = event.data.get('error')
+            root.attributes['attempts'] = call.attempt
+            self._close(root, parent)
+        elif event.name == 'before_request':
+            if self.header:
+                call.headers[self.header] = call.id
+        elif event.name == 'on_cache_hit':
+            root.attributes['cache_hit'] = True
+        else:
+            span = Span(SPAN_NAMES[event.name], root.trace_id, root,
+                        start=event.start)
+            span.end = event.end
+            response = event.data.get('response')
+            if response is not None:
+                span.attributes['status'] = response.status_code
+            if event.name == 'after_response':
+                span.attributes['attempt'] = call.attempt
+                span.error = event.data.get('error')
+            if 'reason' in event.data:
+                span.attributes['reason'] = event.data['reason']
+            root.children.append(span)
+
+
+class OpenTelemetryExporter(object):
+    """Replay finished spans into OpenTelemetry, with their own timing.
+
+    Requires opentelemetry-api; configure the SDK and its exporters (OTLP,
+    Jaeger, ...) as usual. The span tree keeps its structure, and the
+    correlation id of every call is in its ringplus.correlation_id
+    attribute.
+
+    Args:
+        tracer: OpenTelemetry tracer. default: trace.get_tracer('ringplus')
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise RingPlusError('opentelemetry-api is required for '
+                                'OpenTelemetry export')
+        self.trace = trace
+        self.tracer = tracer or trace.get_tracer('ringplus')
+
+    def __call__(self, span):
+        self._export(span, None)
+
+    def _export(self, span, context):
+        attributes = dict(('ringplus.' + key, value) for key, value in
+                          span.attributes.items())
+        attributes['ringplus.trace_id'] = span.trace_id
+        otel_span = self.tracer.start_span(
+            span.name, context=context, start_time=int(span.start * 1e9),
+            attributes=attributes)
+        if span.error is not None:
+            otel_span.record_exception(span.error)
+            otel_span.set_status(self.trace.Status(
+                self.trace.StatusCode.ERROR, str(span.error)))
+        child_context = self.trace.set_span_in_context(otel_span)
+        for child in span.children:
+            self._export(child, child_context)
+        otel_span.end(end_time=int(span.end * 1e9))
@@ -0,0 +1,247 @@
+"""Recording and replaying of HTTP traffic, for offline profiling.
+
+A transport is anything with the request() method of requests.Session.
+API(transport=...) sends every call through it instead of the API's
+session.
+"""
+
+from __future__ import print_function
+
+import collections
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+
+from six.moves.urllib.parse import urlencode
+
+from ringplus.error import RingPlusError
+
+# Request headers never written to an archive
+PRIVATE_HEADERS = ('authorization', 'cookie', 'proxy-authorization')
+# Response headers never written to an archive
+PRIVATE_RESPONSE_HEADERS = ('set-cookie', 'set-cookie2',
+                            'www-authenticate', 'proxy-authenticate')
+# Parameters and form fields whose name contains one of these words are
+# written to an archive as REDACTED, e.g. user[password] or client_secret
+PRIVATE_FIELDS = ('password', 'secret', 'token')
+REDACTED = '[redacted]'
+
+
+def _public(headers, private):
+    """Copy headers without the private ones."""
+    return dict((k, v) for k, v in (headers or {}).items()
+                if k.lower() not in private)
+
+
+def _text(values):
+    """Copy a dict of parameters with bytes values decoded."""
+    if not isinstance(values, dict):
+        return None
+    return dict((k, v.decode('utf-8') if isinstance(v, bytes) else v)
+                for k, v in values.items())
+
+
+def _redacted(values):
+    """Copy a dict of parameters as _text does, without private values."""
+    values = _text(values)
+    if values is None:
+        return None
+    return dict((k, REDACTED if any(word in k.lower()
+                                    for word in PRIVATE_FIELDS) else v)
+                for k, v in values.items())
+
+
+def _request_key(method, url, params):
+    # Private values are redacted in archives, so they can't be matched
+    params = _redacted(params)
+    if params:
+        url += '?' + urlencode(sorted(params.items()))
+    return '%s %s' % (method, url)
+
+
+class RecordingTransport(object):
+    """Send requests through a session and record them to an archive.
+
+    The archive is a gzip compressed JSON Lines file. Every exchange is a
+    line with the request (method, url, params, data and headers, without
+    credentials, passwords, secrets or tokens), the response status,
+    headers (x-rate-limit-*, retry-after, ..., but not cookies) and body,
+    when it was sent relative to the start of the recording and how long
+    it took. Identical bodies are stored once.
+
+    Example:
+        with RecordingTransport('traffic.jsonl.gz') as transport:
+            api = API(auth, transport=transport)
+            run_the_job(api)
+
+    Args:
+        path: Archive to write, replaced if it exists.
+        session: Session sending the requests. default: a requests.Session
+    """
+
+    def __init__(self, path, session=None):
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.path = path
+        self.started = time.time()
+        self._file = gzip.open(path, 'wb')
+        self._bodies = set()
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, headers=None, data=None,
+                **kwargs):
+        sent = time.time()
+        response = self.session.request(method, url, params=params,
+                                        headers=headers, data=data,
+                                        **kwargs)
+        elapsed = time.time() - sent
+        body = response.text
+        digest = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        exchange = {
+            'method': method,
+            'url': url,
+            'params': _redacted(params) or {},
+            'data': _redacted(data),
+            'headers': _public(headers, PRIVATE_HEADERS),
+            'status': response.status_code,
+            'response_headers': _public(response.headers,
+                                        PRIVATE_RESPONSE_HEADERS),
+            'body': digest,
+            'offset': sent - self.started,
+            'elapsed': elapsed,
+        }
+        with self._lock:
+            if digest not in self._bodies:
+                self._bodies.add(digest)
+                self._write({'body_id': digest, 'text': body})
+            self._write(exchange)
+        return response
+
+    def _write(self, line):
+        self._file.write((json.dumps(line, sort_keys=True) + '\n')
+                         .encode('utf-8'))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Headers(dict):
+    """Response headers with case insensitive lookups."""
+
+    def __init__(self, headers):
+        dict.__init__(self, ((k.lower(), v) for k, v in headers.items()))
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key.lower())
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key.lower())
+
+    def get(self, key, default=None):
+        return dict.get(self, key.lower(), default)
+
+
+class ReplayResponse(object):
+    """A recorded response, with the attributes the client uses."""
+
+    def __init__(self, exchange, text):
+        self.status_code = exchange['status']
+        self.headers = _Headers(exchange['response_headers'])
+        self.text = text
+        self.url = exchange['url']
+        self.elapsed = datetime.timedelta(seconds=exchange['elapsed'])
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ReplayTransport(object):
+    """Answer requests from an archive written by RecordingTransport.
+
+    A request gets the recorded responses of the same method, URL and
+    parameters in the order they were recorded, so a 503 followed by a 200
+    replays the retry, and a 429 with retry-after replays the wait. When
+    the responses of a request are used up, they start over if loop is
+    set; otherwise the request fails.
+
+    Example:
+        api = API(transport=ReplayTransport('traffic.jsonl.gz'),
+                  retry_count=3, wait_on_rate_limit=True)
+        run_the_job(api)
+
+    Args:
+        path: Archive to read.
+        timing: 'fast' answers at once. 'recorded' answers each request
+            after its recorded duration, and never before the offset at
+            which its response arrived in the recording, so the traffic
+            keeps its shape. default: 'fast'
+        speed: Divides the recorded durations and offsets. default: 1
+        loop: Start over when a request's responses are used up.
+            default: False
+    """
+
+    def __init__(self, path, timing='fast', speed=1.0, loop=False):
+        if timing not in ('fast', 'recorded'):
+            raise RingPlusError('Unknown replay timing: %s' % timing)
+        self.timing = timing
+        self.speed = float(speed)
+        self.loop = loop
+        self.exchanges = []
+        self._bodies = {}
+        self._queues = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._load(path)
+        self.started = None
+
+    def _load(self, path):
+        with gzip.open(path, 'rb') as f:
+            for line in io.TextIOWrapper(f, encoding='utf-8'):
+                record = json.loads(line)
+                if 'body_id' in record:
+                    self._bodies[record['body_id']] = record['text']
+                    continue
+                self.exchanges.append(record)
+                key = _request_key(record['method'], record['url'],
+                                   record['params'])
+                self._queues[key].append(record)
+
+    def request(self, method, url, params=None, **kwargs):
+        key = _request_key(method, url, params or {})
+        with self._lock:
+            if self.started is None:
+                self.started = time.time()
+            queue = self._queues.get(key)
+            if not queue:
+                raise RingPlusError('No recorded response for %s' % key)
+            exchange = queue.popleft()
+            if self.loop:
+                queue.append(exchange)
+        if self.timing == 'recorded':
+            sent = time.time()
+            arrived = self.started + \
+                (exchange['offset'] + exchange['elapsed']) / self.speed
+            done = max(sent + exchange['elapsed'] / self.speed, arrived)
+            time.sleep(max(0.0, done - time.time()))
+        return ReplayResponse(exchange, self._bodies[exchange['body']])
+
+    def remaining(self):
+        """Return the number of recorded responses not replayed yet."""
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
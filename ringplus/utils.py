@@ -2,6 +2,9 @@
 
 from __future__ import print_function
 
+import os
+import tempfile
+
 import six
 
 
@@ -28,3 +31,29 @@ def import_simplejson():
                 raise ImportError("Can't load a json library.")
 
     return json
+
+
+def atomic_write(path, data):
+    """Write bytes to path so readers never observe a partial file.
+
+    The data is written to a temporary file in the same directory, flushed
+    to disk and then renamed over the destination.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ringplus-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        _replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# os.replace is atomic on every platform but only exists on python 3.3+
+_replace = getattr(os, 'replace', os.rename)
@@ -0,0 +1,270 @@
+"""Near real time notification of new voicemail."""
+
+from __future__ import print_function
+
+import datetime
+import hashlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import iso8601
+from six.moves import queue
+
+from ringplus.parsers import RawParser
+
+log = logging.getLogger('ringplus.watcher')
+
+_STOP = object()
+# Seconds between checks for stop() while waiting on the queue
+_WAIT = 0.5
+
+# Sorts messages without received_on before any other
+_NO_DATE = datetime.datetime.min.replace(tzinfo=iso8601.UTC)
+
+
+class _Box(object):
+    """Polling state of one voicemail box."""
+
+    __slots__ = ('id', 'watermark', 'etag', 'digest', 'interval', 'lock')
+
+    def __init__(self, box_id, watermark, interval):
+        self.id = box_id
+        # (received_on, id) of the newest message delivered so far
+        self.watermark = watermark
+        self.etag = None
+        self.digest = None
+        self.interval = interval
+        # Held while polling, so a message is never emitted twice
+        self.lock = threading.Lock()
+
+
+class VoicemailWatcher(object):
+    """Deliver each new voicemail message of many boxes exactly once.
+
+    Boxes are polled with API.voicemail(only_new=True) by a small worker
+    pool. Each box keeps a watermark, the received_on and id of the newest
+    message delivered, and only messages past it are emitted. A box that
+    keeps returning nothing new is polled less and less often, down to
+    max_interval, and goes back to min_interval as soon as a message
+    arrives.
+
+    Repeated work is avoided where possible: the ETag of the last page is
+    sent with If-None-Match, so a server supporting conditional requests
+    can answer 304, and a page whose body is byte-for-byte the same as
+    last time is not parsed again.
+
+    Messages are passed to the callback, if one is given, and can also be
+    consumed by iterating over the watcher. When a callback is given,
+    messages are only queued for iteration once it has started::
+
+        watcher = VoicemailWatcher(api, box_ids)
+        watcher.start()
+        for box_id, message in watcher:
+            print(box_id, message.transcription)
+
+    Args:
+        api: API instance.
+        box_ids: IDs of the voicemail boxes to watch.
+        callback: Optional callable receiving (box_id, Voicemail). It runs
+            on the worker threads.
+        min_interval: Seconds between polls of an active box. default: 5
+        max_interval: Seconds between polls of an idle box. default: 300
+        backoff: Factor applied to the interval after an idle poll.
+            default: 2
+        max_workers: Boxes polled at once. default: 4
+        per_page: Messages requested per poll. default: 100
+        checkpoint: Optional checkpoint persisting the watermarks, so a
+            restarted watcher does not emit the same messages again.
+        max_queued: Messages waiting to be iterated over at most. Polling
+            waits while the queue is full, 0 doesn't limit it.
+            default: 1000
+    """
+
+    def __init__(self, api, box_ids, callback=None, min_interval=5.0,
+                 max_interval=300.0, backoff=2.0, max_workers=4,
+                 per_page=100, checkpoint=None, max_queued=1000):
+        self.api = api
+        self.callback = callback
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self.per_page = per_page
+        self.checkpoint = checkpoint
+        self.boxes = dict((box_id, _Box(box_id, self._load(box_id),
+                                        min_interval))
+                          for box_id in box_ids)
+        self._queue = queue.Queue(max_queued)
+        # Whether to queue messages for __iter__
+        self._iterating = callback is None
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._executor = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """Start polling every box in the background."""
+        with self._cond:
+            self._executor = ThreadPoolExecutor(self.max_workers)
+            for box in self.boxes.values():
+                self._schedule(box, 0)
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop polling and end iteration."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown()
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            # __iter__ ends once it has emptied the queue
+            pass
+
+    def __iter__(self):
+        self._iterating = True
+        while True:
+            try:
+                item = self._queue.get(timeout=_WAIT)
+            except queue.Empty:
+                if self._stopped:
+                    return
+                continue
+            if item is _STOP:
+                return
+            yield item
+
+    def poll(self, box_id):
+        """Poll one box now and return its new messages.
+
+        Safe to call while the watcher runs; polls of the same box take
+        turns, and a message is returned by only one of them.
+        """
+        box = self.boxes[box_id]
+        with box.lock:
+            return self._poll(box)
+
+    def _poll(self, box):
+        method = self.api.voicemail(box.id, only_new=True,
+                                    per_page=self.per_page,
+                                    parser=RawParser(), use_cache=False,
+                                    headers=self._conditional_headers(box),
+                                    create=True)
+        body = method.execute()
+        if body is None:
+            # 304 Not Modified
+            return []
+        box.etag = method.response.headers.get('etag')
+        digest = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        if digest == box.digest:
+            return []
+        box.digest = digest
+
+        messages = [message for message in
+                    self.api.parser.parse(method, body)
+                    if self._key(message) > (box.watermark or ())]
+        if messages:
+            messages.sort(key=self._key)
+            box.watermark = self._key(messages[-1])
+            self._save(box)
+        return messages
+
+    def _conditional_headers(self, box):
+        if box.etag:
+            return {'If-None-Match': box.etag}
+        return {}
+
+    def _key(self, message):
+        return (getattr(message, 'received_on', None) or _NO_DATE,
+                message.id)
+
+    def _schedule(self, box, delay):
+        # Called with the condition held.
+        heapq.heappush(self._heap, (time.time() + delay,
+                                    next(self._counter), box))
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                box = heapq.heappop(self._heap)[2]
+            try:
+                self._executor.submit(self._check, box)
+            except RuntimeError:
+                # Stopped while dispatching.
+                return
+
+    def _check(self, box):
+        try:
+            messages = self.poll(box.id)
+        except Exception as e:
+            log.warning('Polling voicemail box %s failed: %s', box.id, e)
+            messages = []
+        for index, message in enumerate(messages):
+            if self.callback is not None:
+                try:
+                    self.callback(box.id, message)
+                except Exception:
+                    log.exception('Voicemail callback failed')
+            if self._iterating and not self._enqueue(box, message):
+                log.warning('Watcher stopped with a full queue, dropping '
+                            '%d messages of box %s', len(messages) - index,
+                            box.id)
+                break
+
+        if messages:
+            box.interval = self.min_interval
+        else:
+            box.interval = min(self.max_interval,
+                               box.interval * self.backoff)
+        with self._cond:
+            if not self._stopped:
+                self._schedule(box, box.interval)
+
+    def _enqueue(self, box, message):
+        """Queue a message for __iter__, False if the watcher stopped."""
+        # Waits for room while the queue is full, for at most _WAIT once
+        # stopped, so that stop() does not hang without a consumer.
+        while True:
+            try:
+                self._queue.put((box.id, message), timeout=_WAIT)
+                return True
+            except queue.Full:
+                if self._stopped:
+                    return False
+
+    def _load(self, box_id):
+        if self.checkpoint is None:
+            return None
+        state = self.checkpoint.get('voicemail:%s' % box_id)
+        if not state:
+            return None
+        return (iso8601.parse_date(state['received_on'])
+                if state['received_on'] else _NO_DATE, state['id'])
+
+    def _save(self, box):
+        if self.checkpoint is None:
+            return
+        received_on, message_id = box.watermark
+        self.checkpoint.set('voicemail:%s' % box.id, {
+            'received_on': received_on.isoformat()
+            if received_on != _NO_DATE else None,
+            'id': message_id})
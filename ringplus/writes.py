@@ -0,0 +1,167 @@
+"""Coalescing of account and user updates."""
+
+from __future__ import print_function
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ringplus.error import RingPlusError
+
+log = logging.getLogger('ringplus.writes')
+
+# Resource -> (API method, name of its id parameter)
+RESOURCES = {
+    'account': ('update_account', 'account_id'),
+    'user': ('update_user', 'user_id'),
+}
+
+
+class _Batch(object):
+    """Updates to one resource waiting to be sent as a single request."""
+
+    __slots__ = ('resource', 'resource_id', 'fields', 'futures', 'due')
+
+    def __init__(self, resource, resource_id, due):
+        self.resource = resource
+        self.resource_id = resource_id
+        self.fields = {}
+        self.futures = []
+        self.due = due
+
+
+class WriteQueue(object):
+    """Merge updates to the same account or user made close together.
+
+    The first update to a resource opens a window. Further updates to the
+    same resource made during the window are merged into it, the last value
+    of each field winning, and a single PUT is sent when the window closes.
+    Every update gets a Future resolved with the outcome of the request
+    that carried it.
+
+    Updates to one resource are never sent concurrently: an update arriving
+    while the previous request for that resource is in flight waits for it,
+    so the server sees the writes in order.
+
+    Example:
+        with WriteQueue(api, window=1.0) as writes:
+            for account in accounts:
+                writes.update_account(account.id, name=new_names[account.id])
+
+    Args:
+        api: API instance.
+        window: Seconds to wait for more updates to a resource before
+            sending it. default: 0.5
+        max_workers: Requests sent at once. default: 4
+    """
+
+    def __init__(self, api, window=0.5, max_workers=4):
+        self.api = api
+        self.window = window
+        self.submitted = 0
+        self.sent = 0
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._in_flight = set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def update_account(self, account_id, **fields):
+        """Queue an API.update_account call. Returns a Future."""
+        return self.submit('account', account_id, **fields)
+
+    def update_user(self, user_id, **fields):
+        """Queue an API.update_user call. Returns a Future."""
+        return self.submit('user', user_id, **fields)
+
+    def submit(self, resource, resource_id, **fields):
+        """Queue an update of 'account' or 'user'. Returns a Future."""
+        if resource not in RESOURCES:
+            raise RingPlusError('Unknown resource: %s' % resource)
+        future = Future()
+        key = (resource, resource_id)
+        with self._cond:
+            if self._closed:
+                raise RingPlusError('Write queue is closed')
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(
+                    resource, resource_id, time.time() + self.window)
+            batch.fields.update(fields)
+            batch.futures.append(future)
+            self.submitted += 1
+            self._cond.notify_all()
+        return future
+
+    def flush(self):
+        """Send every queued update now and wait for them to finish."""
+        with self._cond:
+            for batch in self._pending.values():
+                batch.due = 0
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                self._cond.wait()
+
+    def close(self):
+        """Flush queued updates and stop the queue."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    now = time.time()
+                    ready = [key for key, batch in self._pending.items()
+                             if batch.due <= now and
+                             key not in self._in_flight]
+                    if ready:
+                        break
+                    waiting = [batch.due for key, batch in
+                               self._pending.items()
+                               if key not in self._in_flight]
+                    timeout = max(0, min(waiting) - now) if waiting else None
+                    self._cond.wait(timeout)
+                batches = []
+                for key in ready:
+                    batches.append(self._pending.pop(key))
+                    self._in_flight.add(key)
+            for batch in batches:
+                self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        method_name, id_param = RESOURCES[batch.resource]
+        kwargs = dict(batch.fields)
+        kwargs[id_param] = batch.resource_id
+        try:
+            result = getattr(self.api, method_name)(**kwargs)
+        except Exception as e:
+            log.warning('Updating %s %s failed: %s', batch.resource,
+                        batch.resource_id, e)
+            for future in batch.futures:
+                future.set_exception(e)
+        else:
+            for future in batch.futures:
+                future.set_result(result)
+        finally:
+            with self._cond:
+                self.sent += 1
+                self._in_flight.discard((batch.resource, batch.resource_id))
+                self._cond.notify_all()
@@ -0,0 +1,67 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ringplus.api import API
+from ringplus.transport import RecordingTransport, ReplayTransport
+
+
+class FakeResponse(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.status_code = 200
+        self.headers = {'content-type': 'application/json',
+                        'set-cookie': 'session=abc'}
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return FakeResponse(json.dumps({'user': {'id': 1}}))
+
+
+class RecordingTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'traffic.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_update_user(self):
+        session = FakeSession()
+        with RecordingTransport(self.path, session=session) as transport:
+            api = API(transport=transport)
+            api.update_user(user_id=1, email='a@example.com',
+                            password='hunter2')
+        return session
+
+    def test_update_user_password_is_not_recorded(self):
+        session = self.record_update_user()
+        # The password is still sent
+        params = session.requests[0][2]['params']
+        self.assertEqual(params['user[password]'], b'hunter2')
+        with gzip.open(self.path, 'rb') as f:
+            archive = f.read().decode('utf-8')
+        self.assertNotIn('hunter2', archive)
+        self.assertNotIn('session=abc', archive)
+        self.assertIn('a@example.com', archive)
+
+    def test_replay_matches_redacted_call(self):
+        self.record_update_user()
+        api = API(transport=ReplayTransport(self.path))
+        api.update_user(user_id=1, email='a@example.com',
+                        password='other')
+
+
+if __name__ == '__main__':
+    unittest.main()